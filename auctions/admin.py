@@ -1,6 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect, render
+from django.urls import path
 
 from . models import *
+from .imports import FORMATS, describe_errors, import_listings
 
 # Register your models here.
 
@@ -8,5 +12,50 @@ admin.site.register(User)
 admin.site.register(Category)
 admin.site.register(Listing)
 admin.site.register(Bid)
+admin.site.register(ProxyBid)
 admin.site.register(Comment)
 admin.site.register(Watchlist)
+admin.site.register(AuctionResult)
+
+
+class ListingImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row, or JSONL.")
+    format = forms.ChoiceField(choices=[(f, f) for f in FORMATS])
+    seller = forms.ModelChoiceField(User.objects.all())
+    batch_size = forms.IntegerField(initial=1000, min_value=1)
+
+
+# Reject reports are capped so a bad file cannot flood the page.
+MAX_REPORTED_REJECTS = 100
+
+
+@admin.register(ListingImport)
+class ListingImportAdmin(admin.ModelAdmin):
+    list_display = ["name", "seller", "imported", "rejected", "finished", "created"]
+    readonly_fields = ["checksum", "lines_done", "imported", "rejected", "finished"]
+    change_list_template = "admin/auctions/listingimport/change_list.html"
+
+    def get_urls(self):
+        return [
+            path("upload/", self.admin_site.admin_view(self.upload_view),
+                 name="auctions_listingimport_upload"),
+        ] + super().get_urls()
+
+    def upload_view(self, request):
+        form = ListingImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            state, rejects = import_listings(
+                upload, upload.name, form.cleaned_data["seller"],
+                form.cleaned_data["format"], form.cleaned_data["batch_size"])
+            for line, errors in rejects[:MAX_REPORTED_REJECTS]:
+                messages.warning(request, f"Line {line}: {describe_errors(errors)}")
+            messages.success(request, str(state))
+            return redirect("admin:auctions_listingimport_changelist")
+
+        return render(request, "admin/auctions/listingimport/upload.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import listings",
+            "form": form,
+        })
@@ -0,0 +1,202 @@
+import hashlib
+from functools import wraps
+
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from . import caching, history
+from .models import Bid, Comment, Listing
+from .pagination import InvalidCursor, keyset_page
+from .templatetags.listing_images import proxied
+from .views import (
+    BIDS_PER_PAGE, LISTINGS_PER_PAGE, category_counts, comment_page,
+)
+
+# Columns of a listing in feeds and watchlists; a detail adds the rest.
+SUMMARY_FIELDS = [
+    "id", "item", "currency", "current_price", "bid_count", "closed",
+    "ends_at", "category", "image_url", "image_variants",
+]
+
+
+# Every endpoint answers conditional requests before doing any work: its
+# ETag comes from the cached versions of what it shows, so a poll that
+# sends If-None-Match and finds nothing new runs no query and renders
+# nothing. Bids and comments also send Last-Modified, the time of the
+# newest one, which costs one indexed query; it is left out when
+# If-None-Match is sent, since that overrides If-Modified-Since.
+def make_etag(*parts):
+    return hashlib.sha256(
+        ":".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def thumbnail_url(listing):
+    if listing.thumbnail:
+        return reverse("image_variant", args=[listing.thumbnail["jpeg"]])
+    return proxied(listing.image_url) or None
+
+
+def summarize(listing):
+    return {
+        "id": listing.id,
+        "item": listing.item,
+        "currency": listing.currency,
+        "price": listing.current_price,
+        "bids": listing.bid_count,
+        "closed": listing.closed,
+        "ends_at": listing.ends_at,
+        "category": listing.category_id,
+        "thumbnail": thumbnail_url(listing),
+    }
+
+
+def listings_etag(request):
+    return make_etag("listings", caching.feed_version(),
+                     request.GET.get("cursor"))
+
+
+@require_safe
+@condition(etag_func=listings_etag)
+def listings(request):
+    try:
+        page, next_cursor = keyset_page(
+            # The cursor is made from the last row's created time.
+            Listing.objects.filter(closed=False).only(
+                *SUMMARY_FIELDS, "created"),
+            request.GET.get("cursor"), LISTINGS_PER_PAGE)
+    except InvalidCursor:
+        return error("Invalid cursor.", 400)
+    return JsonResponse({
+        "listings": [summarize(listing) for listing in page],
+        "next_cursor": next_cursor,
+    })
+
+
+def listing_required(view):
+    """Answer 404 for unknown listings before their ETag is computed."""
+    @wraps(view)
+    def wrapper(request, id):
+        if caching.existing_listing_version(id) is None:
+            return error("No such listing.", 404)
+        return view(request, id)
+    return wrapper
+
+
+def listing_etag(request, id):
+    return make_etag("listing", id, caching.listing_version(id))
+
+
+@require_safe
+@listing_required
+@condition(etag_func=listing_etag)
+def listing(request, id):
+    listing = Listing.objects.select_related(
+        "category", "created_by", "top_bidder").filter(id=id).first()
+    if listing is None:
+        return error("No such listing.", 404)
+    return JsonResponse({
+        **summarize(listing),
+        "description": listing.description,
+        "starting_price": listing.price,
+        "category_name": listing.category.name,
+        "created": listing.created,
+        "created_by": listing.created_by.username,
+        "top_bidder": listing.top_bidder and listing.top_bidder.username,
+    })
+
+
+def listing_page_etag(kind):
+    def etag(request, id):
+        return make_etag(kind, id, caching.listing_version(id),
+                         request.GET.get("cursor"))
+    return etag
+
+
+def newest(queryset, field):
+    def last_modified(request, id):
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            return None
+        return queryset.filter(item=id).order_by(f"-{field}").values_list(
+            "created", flat=True).first()
+    return last_modified
+
+
+@require_safe
+@listing_required
+@condition(etag_func=listing_page_etag("bids"),
+           # The highest bid is the newest one.
+           last_modified_func=newest(Bid.objects, "bid"))
+def bids(request, id):
+    try:
+        page, next_cursor = history.bid_page(
+            id, request.GET.get("cursor"), BIDS_PER_PAGE)
+    except InvalidCursor:
+        return error("Invalid cursor.", 400)
+    return JsonResponse({
+        "bids": [{
+            "bid": bid.bid,
+            "bid_by": bid.bid_by.username,
+            "created": bid.created,
+        } for bid in page],
+        "next_cursor": next_cursor,
+    })
+
+
+@require_safe
+@listing_required
+@condition(etag_func=listing_page_etag("comments"),
+           last_modified_func=newest(Comment.objects, "created"))
+def comments(request, id):
+    try:
+        page, next_cursor = comment_page(id, request.GET.get("cursor"))
+    except InvalidCursor:
+        return error("Invalid cursor.", 400)
+    return JsonResponse({
+        "comments": [{
+            "id": comment.id,
+            "content": comment.content,
+            "created": comment.created,
+            "created_by": comment.created_by.username,
+        } for comment in page],
+        "next_cursor": next_cursor,
+    })
+
+
+def categories_etag(request):
+    return make_etag("categories", caching.catalog_version())
+
+
+@require_safe
+@condition(etag_func=categories_etag)
+def categories(request):
+    return JsonResponse({"categories": [{
+        "id": category.id,
+        "name": category.name,
+        "open_listings": category.open_listings,
+    } for category in category_counts()]})
+
+
+def watchlist_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    versions = caching.listing_versions(
+        caching.watched_listing_ids(request.user))
+    return make_etag("watchlist", request.user.id, *sorted(versions.items()))
+
+
+@require_safe
+@condition(etag_func=watchlist_etag)
+def watchlist(request):
+    if not request.user.is_authenticated:
+        return error("Not signed in.", 401)
+    watched = Listing.objects.filter(
+        watchlist__user=request.user).only(*SUMMARY_FIELDS).order_by(
+            "-watchlist__id")
+    return JsonResponse({
+        "listings": [summarize(listing) for listing in watched],
+    })
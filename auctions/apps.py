@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from . import checks  # noqa: F401 (registers the system checks)
+        from .auth import user_changed
+        from .caching import (
+            category_saved, listing_child_saved, listing_saved, watchlist_saved,
+        )
+        from .database import configure_sqlite
+        from .instrumentation import install_query_instrumentation
+        from .models import Bid, Category, Comment, Listing, User, Watchlist
+        from .search import ensure_triggers
+        connection_created.connect(configure_sqlite)
+        connection_created.connect(install_query_instrumentation)
+        post_migrate.connect(ensure_triggers, sender=self)
+        for signal in (post_save, post_delete):
+            signal.connect(listing_saved, sender=Listing)
+            signal.connect(listing_child_saved, sender=Bid)
+            signal.connect(listing_child_saved, sender=Comment)
+            signal.connect(category_saved, sender=Category)
+            signal.connect(user_changed, sender=User)
+            signal.connect(watchlist_saved, sender=Watchlist)
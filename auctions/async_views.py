@@ -0,0 +1,147 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.http import HttpResponseBadRequest, HttpResponseNotFound, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import caching, facets
+from .models import Category, Listing, Watchlist
+from .pagination import InvalidCursor
+from .views import (
+    BidForm, CommentForm, LISTINGS_PER_PAGE, ProxyBidForm, WatchlistForm,
+    category_counts, category_page, comment_page,
+)
+
+
+def _run_query(fn, *args):
+    try:
+        return fn(*args)
+    finally:
+        # Worker threads never see request_finished, so honour
+        # CONN_MAX_AGE here instead.
+        connection.close_if_unusable_or_obsolete()
+
+
+async def read(fn, *args):
+    """Run the blocking ORM call ``fn(*args)`` off the event loop.
+
+    Calls are not thread-sensitive, so several reads awaited together run
+    in parallel worker threads, each on its own database connection.
+    """
+    return await sync_to_async(_run_query, thread_sensitive=False)(fn, *args)
+
+
+async def authenticated(request):
+    """Resolve the lazy request.user before templates touch it."""
+    return await read(lambda: request.user.is_authenticated)
+
+
+async def index(request):
+    try:
+        filters = facets.parse_filters(request.GET)
+    except facets.InvalidFilter:
+        return HttpResponseBadRequest("Invalid filter!")
+    try:
+        (listings, next_cursor), counts, watched = await asyncio.gather(
+            read(facets.feed_page, filters, request.GET.get("cursor"),
+                 LISTINGS_PER_PAGE),
+            read(facets.facet_counts, filters),
+            read(caching.watched_listing_ids, request.user),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor!")
+
+    return render(request, "auctions/index.html", {
+        "listings": await read(caching.with_versions, listings),
+        "next_cursor": next_cursor,
+        "watched": watched,
+        "filters": filters,
+        "filter_query": facets.query_string(filters),
+        "facets": counts,
+    })
+
+
+async def listing(request, id):
+    def get_item():
+        return Listing.objects.select_related(
+            "top_bidder", "created_by", "category").filter(id=id).first()
+
+    def is_watchlisted():
+        return id in caching.watched_listing_ids(request.user)
+
+    try:
+        item, (comments, next_comments), watchlisted = await asyncio.gather(
+            read(get_item),
+            read(comment_page, id, request.GET.get("comments")),
+            read(is_watchlisted),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor!")
+    if item is None:
+        return HttpResponseNotFound("No such listing!")
+
+    return render(request, "auctions/listing.html", {
+        "item": item,
+        "price": item.current_price,
+        "total_bids": item.bid_count,
+        "is_max_bid": request.user.id is not None and
+        item.top_bidder_id == request.user.id,
+        "max_bid_user": item.top_bidder,
+        "watchlisted": watchlisted,
+        "watchlist_form": WatchlistForm(None, initial={
+            "item": item,
+            "delete": watchlisted,
+        }),
+        "bid_form": BidForm(None, initial={
+            "item": item,
+            "bid": 0,
+        }),
+        "proxy_bid_form": ProxyBidForm(None, initial={
+            "item": item,
+        }),
+        "comments": comments,
+        "next_comments": next_comments,
+        "comment_form": CommentForm(None, initial={
+            "item": item,
+            "content": "",
+        }),
+    })
+
+
+async def category(request, id=0):
+    if id > 0:
+        try:
+            category, (listings, next_cursor), _ = await asyncio.gather(
+                read(lambda: Category.objects.filter(id=id).first()),
+                read(category_page, id, request.GET.get("cursor")),
+                authenticated(request),
+            )
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor!")
+        if category is None:
+            return HttpResponseNotFound("No such category!")
+        return render(request, "auctions/category.html", {
+            "category": category,
+            "listings": await read(caching.with_versions, listings),
+            "next_cursor": next_cursor,
+        })
+    else:
+        categories, _ = await asyncio.gather(
+            read(category_counts),
+            authenticated(request),
+        )
+        return render(request, "auctions/categories.html", {
+            "categories": categories
+        })
+
+
+async def watchlist(request):
+    if not await authenticated(request):
+        return HttpResponseRedirect(reverse("login"))
+    watchlist = await read(lambda: list(Watchlist.objects.filter(
+        user=request.user).select_related("item").order_by("-id")))
+    return render(request, "auctions/watchlist.html", {
+        "watchlist": watchlist
+    })
@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .caching import listings_changed
+from .database import retry_on_lock
+from .events import publish_listing
+from .models import Bid, Listing, ProxyBid
+
+
+def is_open():
+    return Q(closed=False) & (
+        Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()))
+
+
+@retry_on_lock
+def place_bid(item_id, user, amount):
+    """Record a bid if it beats the current price of an open listing.
+
+    Acceptance is a single conditional UPDATE on the listing row, so the
+    database serializes competing bidders: SQLite through its write lock,
+    row-locking databases through the lock taken by the UPDATE. Whoever
+    loses the race simply matches no row, as does a bid on a listing whose
+    end time has passed but that the expiry sweep has not closed yet.
+    Proxy bids of other users then answer the new price in the same
+    transaction. Live subscribers are told about the new price once the
+    transaction commits. Bids that find the database locked are retried.
+    Returns the new Bid, or None when the bid was rejected.
+    """
+    with transaction.atomic():
+        accepted = Listing.objects.filter(
+            is_open(), id=item_id, current_price__lt=amount,
+        ).update(
+            current_price=amount,
+            top_bidder=user,
+            bid_count=F("bid_count") + 1,
+        )
+        if not accepted:
+            return None
+        bid = Bid.objects.create(item_id=item_id, bid=amount, bid_by=user)
+        listing = Listing.objects.only(
+            "current_price", "top_bidder", "bid_count", "closed",
+            "price_bucket").get(id=item_id)
+        # Also moves the listing to the price bucket of its new price.
+        settle(listing)
+        transaction.on_commit(lambda: publish_listing(listing))
+        return bid
+
+
+@retry_on_lock
+def place_proxy_bid(item_id, user, maximum):
+    """Let the engine bid for ``user`` on an open listing, up to ``maximum``.
+
+    The maximum is stored, replacing any earlier one of the user, and
+    resolved against the proxy bids of everyone else in one transaction:
+    only the bids that a war of single increments would have ended with
+    are written, along with the final price. Returns the list of bids
+    placed, which is empty when the user already leads, or None when the
+    listing is not open or ``maximum`` does not beat its current price.
+    """
+    with transaction.atomic():
+        # Locks the row on databases that lock rows. On SQLite, a bid
+        # committed between this read and the writes below makes them
+        # fail as locked, and the whole call is retried.
+        listing = Listing.objects.select_for_update().only(
+            "current_price", "top_bidder", "bid_count", "closed",
+            "price_bucket").filter(
+                is_open(), id=item_id, current_price__lt=maximum).first()
+        if listing is None:
+            return None
+        if not ProxyBid.objects.filter(item_id=item_id, bidder=user).update(
+                maximum=maximum, placed=timezone.now()):
+            ProxyBid.objects.create(
+                item_id=item_id, bidder=user, maximum=maximum)
+        bids = settle(listing)
+        if bids:
+            transaction.on_commit(lambda: publish_listing(listing))
+        return bids
+
+
+def settle(listing):
+    """Let proxy bids answer the current price of a locked listing.
+
+    Writes the resulting bids with one INSERT and the listing's final
+    price, and the price bucket it moved to, with one UPDATE, updates
+    ``listing`` to match, and returns the new Bids. Neither sends signals,
+    so cached pages are invalidated here.
+    """
+    # Every earlier settlement left at most the leader above the price,
+    # so the two highest maximums decide it.
+    proxies = list(ProxyBid.objects.filter(
+        item_id=listing.id, maximum__gt=listing.current_price,
+    ).order_by("-maximum", "placed", "id").values_list(
+        "bidder_id", "maximum")[:2])
+    bids = [Bid(item_id=listing.id, bid_by_id=bidder, bid=amount)
+            for bidder, amount in resolve(
+                listing.current_price, listing.top_bidder_id, proxies)]
+    if bids:
+        # Inserted in ascending order, so the newest bid stays the highest.
+        Bid.objects.bulk_create(bids)
+        listing.current_price = bids[-1].bid
+        listing.top_bidder_id = bids[-1].bid_by_id
+        listing.bid_count += len(bids)
+    bucket = Listing.bucket_of(listing.current_price)
+    moved = bucket != listing.price_bucket
+    if not bids and not moved:
+        return []
+    listing.price_bucket = bucket
+    Listing.objects.filter(id=listing.id).update(
+        current_price=listing.current_price,
+        top_bidder=listing.top_bidder_id,
+        bid_count=listing.bid_count,
+        price_bucket=listing.price_bucket,
+    )
+    listings_changed(listing.id, prices=moved)
+    return bids
+
+
+def resolve(price, leader_id, proxies):
+    """Work out what competing proxy bids place against ``price``.
+
+    ``proxies`` holds the (bidder id, maximum) of the highest maximums
+    above ``price``, highest first and, among equal maximums, earliest
+    first. The runner-up bids its whole maximum, and the highest proxy
+    answers one increment above it, never beyond its own maximum. Returns
+    the (bidder id, amount) bids to record, in ascending order of amount;
+    the last one leads.
+    """
+    if not proxies:
+        return []
+    top, maximum = proxies[0]
+    if len(proxies) == 1:
+        if top == leader_id:
+            return []
+        return [(top, min(maximum, round(price + increment(price), 2)))]
+    runner, base = proxies[1]
+    amount = min(maximum, round(base + increment(base), 2))
+    if amount == base:
+        # Equal maximums: the earlier proxy gets there first.
+        return [(top, amount)]
+    return [(runner, base), (top, amount)]
+
+
+def increment(price):
+    """Return the step by which proxy bids outbid ``price``."""
+    step = settings.BID_INCREMENTS[0][1]
+    for start, amount in settings.BID_INCREMENTS:
+        if price < start:
+            break
+        step = amount
+    return step
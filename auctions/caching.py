@@ -0,0 +1,190 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .models import Listing, Watchlist
+
+FEED_KEY = "auctions:feed-version"
+CATALOG_KEY = "auctions:catalog-version"
+PRICES_KEY = "auctions:prices-version"
+
+
+def listing_key(id):
+    return f"auctions:listing-version:{id}"
+
+
+def new_version():
+    # Versions start from the clock rather than 1, so a counter that was
+    # evicted never comes back with a value an old cache entry was stored
+    # under.
+    return time.time_ns()
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def feed_version():
+    """Version of everything shown in listing feeds as a whole."""
+    return _version(FEED_KEY)
+
+
+def catalog_version():
+    """Version of which listings exist, are open and in which category.
+
+    Unlike the feed version it does not move on bids and comments.
+    """
+    return _version(CATALOG_KEY)
+
+
+def prices_version():
+    """Version of which price bucket each listing is in.
+
+    Bids only move it when they take a listing into another bucket.
+    """
+    return _version(PRICES_KEY)
+
+
+def listing_versions(ids):
+    """Map each listing id to the current version of that listing."""
+    keys = {listing_key(id): id for id in ids}
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def listing_version(id):
+    return listing_versions([id])[id]
+
+
+def existing_listing_version(id):
+    """Like listing_version(), but None when no listing has that id.
+
+    The database is only asked when no version is cached, so requests for
+    made-up ids never leave a version behind in the cache.
+    """
+    version = cache.get(listing_key(id))
+    if version is None and Listing.objects.filter(id=id).exists():
+        version = listing_version(id)
+    return version
+
+
+def with_versions(listings):
+    """Attach ``version`` to each listing, for keying its row fragment."""
+    listings = list(listings)
+    versions = listing_versions([listing.id for listing in listings])
+    for listing in listings:
+        listing.version = versions[listing.id]
+    return listings
+
+
+def listings_changed(*ids, catalog=False, prices=False):
+    """Invalidate cached output for the given listings and the feeds.
+
+    ``catalog`` also invalidates what depends on the set of listings,
+    such as category counts, and ``prices`` what depends on their price
+    buckets, such as price counts. Versions move now and again once the
+    transaction commits: a page rendered in between from the old rows is
+    stored under a version that is already superseded.
+    """
+    def bump():
+        for id in ids:
+            _bump(listing_key(id))
+        _bump(FEED_KEY)
+        if catalog:
+            _bump(CATALOG_KEY)
+        if prices:
+            _bump(PRICES_KEY)
+    bump()
+    transaction.on_commit(bump)
+
+
+def cached_value(key, compute):
+    """Return ``compute()``, cached under ``key`` (a tuple of versions)."""
+    key = "auctions:value:" + ":".join(str(part) for part in key)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, getattr(settings, "PAGE_CACHE_TIMEOUT", 600))
+    return value
+
+
+def watched_key(user_id):
+    return f"auctions:watched:{user_id}"
+
+
+def watched_listing_ids(user):
+    """The ids of the listings ``user`` watches, as a frozenset."""
+    if not user.is_authenticated:
+        return frozenset()
+    watched = cache.get(watched_key(user.id))
+    if watched is None:
+        watched = frozenset(Watchlist.objects.filter(
+            user=user).values_list("item_id", flat=True))
+        cache.set(watched_key(user.id), watched, None)
+    return watched
+
+
+def watchlist_changed(user_id):
+    """Drop the cached watched set of a user, now and on commit."""
+    def forget():
+        cache.delete(watched_key(user_id))
+    forget()
+    transaction.on_commit(forget)
+
+
+def cached_page(request, key, render):
+    """Serve ``render()`` from the cache to logged-out visitors.
+
+    ``key`` must contain the versions of everything the page shows.
+    Responses that are not 200 or that set the CSRF cookie are never
+    stored.
+    """
+    if request.user.is_authenticated:
+        return render()
+    key = "auctions:page:" + ":".join(str(part) for part in key)
+    cached = cache.get(key)
+    if cached is not None:
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    response = render()
+    if response.status_code == 200 and \
+            not request.META.get("CSRF_COOKIE_USED"):
+        cache.set(key, (response.content, response["Content-Type"]),
+                  getattr(settings, "PAGE_CACHE_TIMEOUT", 600))
+    return response
+
+
+def listing_saved(sender, instance, **kwargs):
+    listings_changed(instance.id, catalog=True)
+
+
+def listing_child_saved(sender, instance, **kwargs):
+    listings_changed(instance.item_id)
+
+
+def category_saved(sender, instance, **kwargs):
+    listings_changed(catalog=True)
+
+
+def watchlist_saved(sender, instance, **kwargs):
+    watchlist_changed(instance.user_id)
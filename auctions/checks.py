@@ -0,0 +1,94 @@
+import logging
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from django.core.checks import Warning, register, run_checks
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+PERFORMANCE = "performance"
+
+CACHED_LOADER = "django.template.loaders.cached.Loader"
+PER_PROCESS_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def uses_cached_loader(template_settings):
+    options = template_settings.get("OPTIONS", {})
+    loaders = options.get("loaders")
+    if loaders is None:
+        # Django caches templates by itself unless the engine debugs.
+        return not options.get("debug", settings.DEBUG)
+    return any(loader == CACHED_LOADER or
+               isinstance(loader, (list, tuple)) and loader[0] == CACHED_LOADER
+               for loader in loaders)
+
+
+@register(PERFORMANCE)
+def check_production_settings(app_configs, **kwargs):
+    """Warn about settings that make the production profile slow."""
+    if getattr(settings, "PROFILE", "development") != "production":
+        return []
+    warnings = []
+    if settings.DEBUG:
+        warnings.append(Warning(
+            "DEBUG is on in the production profile.",
+            hint="Every executed query is kept in memory per request. "
+                 "Unset COMMERCE_DEBUG.",
+            id="auctions.W001"))
+    for template in settings.TEMPLATES:
+        if template["BACKEND"].endswith("DjangoTemplates") and \
+                not uses_cached_loader(template):
+            warnings.append(Warning(
+                f"Templates of {template['BACKEND']} are not cached.",
+                hint=f"Wrap the loaders in {CACHED_LOADER}.",
+                id="auctions.W002"))
+    for alias, database in settings.DATABASES.items():
+        if not database.get("CONN_MAX_AGE"):
+            warnings.append(Warning(
+                f"Database '{alias}' opens a new connection per request.",
+                hint="Set CONN_MAX_AGE (COMMERCE_CONN_MAX_AGE).",
+                id="auctions.W003"))
+        if database["ENGINE"].endswith("sqlite3") and str(getattr(
+                settings, "SQLITE_PRAGMAS", {}).get(
+                    "journal_mode", "")).lower() != "wal":
+            warnings.append(Warning(
+                "SQLite is not in WAL mode; writes block every reader.",
+                hint="Set 'journal_mode': 'wal' in SQLITE_PRAGMAS.",
+                id="auctions.W004"))
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend in PER_PROCESS_CACHES:
+        warnings.append(Warning(
+            f"The default cache is {backend.rsplit('.', 1)[1]}.",
+            hint="Cached pages and their invalidations are not shared "
+                 "between worker processes; use a shared backend.",
+            id="auctions.W005"))
+    if not issubclass(import_string(settings.STATICFILES_STORAGE),
+                      ManifestFilesMixin):
+        warnings.append(Warning(
+            "Static files are not stored under hashed names.",
+            hint="Use ManifestStaticFilesStorage so they can be cached "
+                 "forever.",
+            id="auctions.W006"))
+    if settings.SESSION_ENGINE == "django.contrib.sessions.backends.db":
+        warnings.append(Warning(
+            "Sessions are read from the database on every request.",
+            hint="Use the cached_db, cache or signed_cookies engine.",
+            id="auctions.W007"))
+    if "django.contrib.auth.backends.ModelBackend" in \
+            settings.AUTHENTICATION_BACKENDS:
+        warnings.append(Warning(
+            "The signed-in user is read from the database on every request.",
+            hint="Use auctions.auth.CachedModelBackend "
+                 "(COMMERCE_CACHE_USERS=1).",
+            id="auctions.W008"))
+    return warnings
+
+
+def report_startup_problems():
+    """Log performance warnings; WSGI and ASGI servers run no checks."""
+    for message in run_checks(tags=[PERFORMANCE]):
+        logger.warning("%s", message)
@@ -0,0 +1,49 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+# The largest SQLite INTEGER, and so the largest possible primary key.
+MAX_INTEGER = 2 ** 63 - 1
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection."""
+    if connection.vendor != "sqlite":
+        return
+    # The raw connection, so these never count as queries of a request.
+    for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+        connection.connection.execute(f"PRAGMA {name}={value}")
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and "locked" in str(error)
+
+
+def retry_on_lock(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Retry ``func`` when SQLite reports the database as locked.
+
+    SQLite fails some writes at once instead of waiting out busy_timeout,
+    when waiting could deadlock. Running the whole unit of work again is
+    then safe, as long as it is not nested in an outer transaction that
+    already rolled back; those errors are re-raised. Retries
+    (SQLITE_LOCK_RETRIES) are spaced by a short, jittered, growing pause.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, "SQLITE_LOCK_RETRIES", 5)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt >= retries or \
+                        connections[using].in_atomic_block:
+                    raise
+            attempt += 1
+            time.sleep(random.uniform(0.5, 1.5) * 0.005 * 2 ** attempt)
+    return wrapper
@@ -0,0 +1,139 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBackend:
+    """Delivers events to subscribers in the publishing process only."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, listing_id, event):
+        self.dispatch(listing_id, event)
+
+    def dispatch(self, listing_id, event):
+        with self.lock:
+            callbacks = list(self.subscribers.get(listing_id, ()))
+        for callback in callbacks:
+            callback(event)
+
+    def subscribe(self, listing_id, callback):
+        """Call ``callback(event)`` for every event of the listing.
+
+        Callbacks may run on any thread. Returns a function that cancels
+        the subscription.
+        """
+        with self.lock:
+            self.subscribers[listing_id].add(callback)
+
+        def unsubscribe():
+            with self.lock:
+                self.subscribers[listing_id].discard(callback)
+                if not self.subscribers[listing_id]:
+                    del self.subscribers[listing_id]
+        return unsubscribe
+
+
+class SQLiteBackend(InProcessBackend):
+    """Shares events between worker processes through a SQLite file.
+
+    Publishers append rows to an events table; one poller thread per
+    process reads rows newer than the last one it saw and dispatches them
+    to that process's subscribers. Rows older than ``retention`` seconds
+    are pruned by publishers.
+    """
+
+    def __init__(self, path, poll_interval=0.25, retention=60):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.local = threading.local()
+        self.poller = None
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, listing_id INTEGER,"
+                " payload TEXT, created REAL)")
+            self.last_id = db.execute(
+                "SELECT coalesce(max(id), 0) FROM events").fetchone()[0]
+
+    def connect(self):
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.path, timeout=5)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+        return self.local.db
+
+    def publish(self, listing_id, event):
+        now = time.time()
+        with self.connect() as db:
+            db.execute(
+                "INSERT INTO events (listing_id, payload, created)"
+                " VALUES (?, ?, ?)", (listing_id, json.dumps(event), now))
+            db.execute("DELETE FROM events WHERE created < ?",
+                       (now - self.retention,))
+
+    def subscribe(self, listing_id, callback):
+        with self.lock:
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, daemon=True)
+                self.poller.start()
+        return super().subscribe(listing_id, callback)
+
+    def poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = self.connect().execute(
+                    "SELECT id, listing_id, payload FROM events"
+                    " WHERE id > ? ORDER BY id", (self.last_id,)).fetchall()
+            except sqlite3.Error:
+                logger.exception("Polling auction events failed")
+                continue
+            for id, listing_id, payload in rows:
+                self.last_id = id
+                self.dispatch(listing_id, json.loads(payload))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide backend configured by AUCTION_EVENTS."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, "AUCTION_EVENTS", {})
+            backend = import_string(
+                config.get("BACKEND", "auctions.events.InProcessBackend"))
+            _backend = backend(**config.get("OPTIONS", {}))
+        return _backend
+
+
+def publish(listing_id, price, bid_count, closed):
+    """Announce the new state of a listing to its live subscribers."""
+    try:
+        get_backend().publish(listing_id, {
+            "price": price,
+            "bid_count": bid_count,
+            "closed": closed,
+        })
+    except Exception:
+        # Live updates are best effort; the write itself already succeeded.
+        logger.exception("Publishing auction event failed")
+
+
+def publish_listing(listing):
+    publish(listing.id, listing.current_price, listing.bid_count,
+            listing.closed)
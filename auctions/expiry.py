@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .caching import listings_changed
+from .database import retry_on_lock
+from .events import publish
+from .models import AuctionResult, Bid, Listing
+
+
+def winning_bids(listing_ids):
+    """Map listing ids to their winning Bid, in one grouped query.
+
+    place_bid only accepts bids above the current price, so the winning
+    bid of a listing is also its newest one.
+    """
+    newest = Bid.objects.filter(item__in=listing_ids).values(
+        "item").annotate(newest=Max("id")).values("newest")
+    return {bid.item_id: bid for bid in Bid.objects.filter(id__in=newest)}
+
+
+def record_results(listing_ids):
+    """Record the outcome of closed listings; existing results are kept."""
+    winners = winning_bids(listing_ids)
+    AuctionResult.objects.bulk_create([
+        AuctionResult(
+            listing_id=id,
+            winning_bid=winners.get(id),
+            winner_id=winners[id].bid_by_id if id in winners else None,
+            price=winners[id].bid if id in winners else None)
+        for id in listing_ids
+    ], ignore_conflicts=True)
+
+
+@retry_on_lock
+def close_expired_batch(now=None, batch_size=500):
+    """Close up to ``batch_size`` expired listings and record their results.
+
+    Returns the ids of the listings closed. Closing, and recording the
+    results, happen in one transaction, so running it again after a crash
+    neither skips nor duplicates anything.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(Listing.objects.filter(
+            closed=False, ends_at__lte=now).order_by("ends_at").values_list(
+                "id", "current_price", "bid_count")[:batch_size])
+        ids = [id for id, _, _ in expired]
+        if not ids:
+            return []
+        record_results(ids)
+        Listing.objects.filter(id__in=ids, closed=False).update(closed=True)
+        listings_changed(*ids, catalog=True)
+        transaction.on_commit(lambda: [
+            publish(id, price, bid_count, True)
+            for id, price, bid_count in expired])
+    return ids
+
+
+def close_expired(now=None, batch_size=500):
+    """Close every listing that has expired by ``now``; returns the count."""
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        ids = close_expired_batch(now, batch_size)
+        if not ids:
+            return closed
+        closed += len(ids)
@@ -0,0 +1,167 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .database import MAX_INTEGER
+from .models import Bid, Comment, Listing
+
+CHUNK_SIZE = 2000
+
+# For each exportable model: the columns (output name -> ORM lookup, with
+# foreign key names resolved through joins in the same query), plus the
+# lookups used to filter by category, closed state and time.
+EXPORTS = {
+    "listings": {
+        "model": Listing,
+        "columns": {
+            "id": "id",
+            "item": "item",
+            "description": "description",
+            "currency": "currency",
+            "price": "price",
+            "current_price": "current_price",
+            "bid_count": "bid_count",
+            "category": "category__name",
+            "closed": "closed",
+            "created": "created",
+            "created_by": "created_by__username",
+            "top_bidder": "top_bidder__username",
+        },
+        "category": "category",
+        "closed": "closed",
+        "time": "created",
+    },
+    "bids": {
+        "model": Bid,
+        "columns": {
+            "id": "id",
+            "listing_id": "item_id",
+            "listing": "item__item",
+            "currency": "item__currency",
+            "bid": "bid",
+            "bid_by": "bid_by__username",
+            "created": "created",
+        },
+        "category": "item__category",
+        "closed": "item__closed",
+        "time": "created",
+    },
+    "comments": {
+        "model": Comment,
+        "columns": {
+            "id": "id",
+            "listing_id": "item_id",
+            "listing": "item__item",
+            "content": "content",
+            "created": "created",
+            "created_by": "created_by__username",
+        },
+        "category": "item__category",
+        "closed": "item__closed",
+        "time": "created",
+    },
+}
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def parse_time(value):
+    try:
+        parsed = parse_datetime(value) or parse_date(value)
+    except ValueError:
+        # Well formed, but no such day or time, like 2020-02-30.
+        parsed = None
+    if parsed is None:
+        raise InvalidExport(f"Invalid date or time: {value}")
+    return parsed
+
+
+def parse_closed(value):
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise InvalidExport(f"Invalid closed filter: {value}")
+
+
+def parse_filters(params):
+    """Build export_rows() keyword arguments from request or CLI strings."""
+    filters = {}
+    if params.get("category"):
+        try:
+            filters["category"] = int(params["category"])
+        except ValueError:
+            raise InvalidExport(f"Invalid category: {params['category']}")
+        if not 0 < filters["category"] <= MAX_INTEGER:
+            raise InvalidExport(f"Invalid category: {params['category']}")
+    if params.get("closed"):
+        filters["closed"] = parse_closed(params["closed"])
+    for name in ("since", "until"):
+        if params.get(name):
+            filters[name] = parse_time(params[name])
+    return filters
+
+
+def export_rows(kind, category=None, closed=None, since=None, until=None):
+    """Return an iterator of dicts, one per row of ``kind``.
+
+    Rows come from a single joined query read ``CHUNK_SIZE`` at a time, so
+    memory use does not depend on how many rows match.
+    """
+    if kind not in EXPORTS:
+        raise InvalidExport(f"Unknown export: {kind}")
+    export = EXPORTS[kind]
+
+    filters = {}
+    if category is not None:
+        filters[export["category"]] = category
+    if closed is not None:
+        filters[export["closed"]] = closed
+    if since is not None or until is not None:
+        if export["time"] is None:
+            raise InvalidExport(f"{kind} cannot be filtered by time")
+        if since is not None:
+            filters[f"{export['time']}__gte"] = since
+        if until is not None:
+            filters[f"{export['time']}__lt"] = until
+
+    names = list(export["columns"])
+    rows = (
+        export["model"].objects.filter(**filters)
+        .order_by("id")
+        .values_list(*export["columns"].values())
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return (dict(zip(names, row)) for row in rows)
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def render_rows(kind, rows, format):
+    """Return an iterator over the encoded lines of ``rows``."""
+    if format == "ndjson":
+        return (json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+    if format == "csv":
+        return _csv_lines(kind, rows)
+    raise InvalidExport(f"Unknown format: {format}")
+
+
+def _csv_lines(kind, rows):
+    writer = csv.DictWriter(Echo(), fieldnames=list(EXPORTS[kind]["columns"]))
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
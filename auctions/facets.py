@@ -0,0 +1,204 @@
+import math
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from django.db.models import Count, Q
+
+from . import caching
+from .database import MAX_INTEGER
+from .models import Category, Listing
+from .pagination import keyset_page
+
+# Query parameters of the feed, in the order they appear in links.
+PARAMETERS = ["status", "category", "currency", "min_price", "max_price"]
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def parse_filters(params):
+    """Build feed filters from query parameters.
+
+    ``min_price`` is inclusive and ``max_price`` exclusive, like the
+    ranges of the price facet. Listings are open unless ``status`` is
+    "closed". Raises InvalidFilter for malformed values.
+    """
+    filters = {}
+    status = params.get("status", "open")
+    if status not in ("open", "closed"):
+        raise InvalidFilter(f"Invalid status: {status}")
+    if status == "closed":
+        filters["status"] = status
+    if params.get("category"):
+        try:
+            filters["category"] = int(params["category"])
+        except ValueError:
+            raise InvalidFilter(f"Invalid category: {params['category']}")
+        if not 0 < filters["category"] <= MAX_INTEGER:
+            raise InvalidFilter(f"Invalid category: {params['category']}")
+    if params.get("currency"):
+        currency = params["currency"].upper()
+        if len(currency) != 3 or not currency.isalpha():
+            raise InvalidFilter(f"Invalid currency: {params['currency']}")
+        filters["currency"] = currency
+    for name in ("min_price", "max_price"):
+        if params.get(name):
+            try:
+                filters[name] = float(params[name])
+            except ValueError:
+                raise InvalidFilter(f"Invalid {name}: {params[name]}")
+            if not math.isfinite(filters[name]):
+                raise InvalidFilter(f"Invalid {name}: {params[name]}")
+    return filters
+
+
+def format_value(value):
+    """Format a filter value so that parsing it gives the same value."""
+    if isinstance(value, float):
+        # Whole prices without the ".0", anything else exactly.
+        return str(int(value)) if value.is_integer() and \
+            abs(value) < 2 ** 53 else repr(value)
+    return value
+
+
+def query_string(filters):
+    """Encode filters back into query parameters, in a stable order.
+
+    Part of the cache key of filtered pages, so distinct filters must
+    never encode alike.
+    """
+    return urlencode([(name, format_value(filters[name]))
+                      for name in PARAMETERS if name in filters])
+
+
+def listing_filter(filters, ignore=None):
+    """The condition for listings matching ``filters``.
+
+    ``ignore`` leaves out one facet ("category", "currency" or "price"),
+    so its counts show what choosing another value would match.
+    """
+    condition = Q(closed=filters.get("status") == "closed")
+    for name in ("category", "currency"):
+        if name in filters and ignore != name:
+            condition &= Q(**{name: filters[name]})
+    if ignore != "price" and ("min_price" in filters or
+                              "max_price" in filters):
+        # The buckets pick the rows out of indexes in feed order; the
+        # exact bounds only sift the buckets at either end.
+        condition &= Q(price_bucket__in=price_buckets(filters))
+        if "min_price" in filters:
+            condition &= Q(current_price__gte=filters["min_price"])
+        if "max_price" in filters:
+            condition &= Q(current_price__lt=filters["max_price"])
+    return condition
+
+
+def price_buckets(filters):
+    """The price buckets holding prices between the filter bounds."""
+    low = Listing.bucket_of(filters.get("min_price", 0))
+    high = len(Listing.PRICE_BUCKETS) - 1
+    if "max_price" in filters:
+        # The bound is exclusive, so a bucket starting at it is left out.
+        high = max(bisect_left(
+            Listing.PRICE_BUCKETS, filters["max_price"]) - 1, 0)
+    return list(range(low, high + 1))
+
+
+def feed_page(filters, cursor=None, per_page=25):
+    return keyset_page(Listing.objects.filter(listing_filter(filters)),
+                       cursor, per_page)
+
+
+def facet_counts(filters):
+    """Count matching listings per category, currency and price range.
+
+    Each facet is one grouped query that ignores its own filter. Returns
+    one dict per facet, with the query string that clears it and its
+    options, each with the query string that selects it. Counts are
+    cached and survive the bids that keep listings in their price bucket,
+    except category and currency counts under price bounds that split a
+    bucket.
+    """
+    bounds = [filters[name] for name in ("min_price", "max_price")
+              if name in filters]
+    if not bounds:
+        version = (caching.catalog_version(),)
+    elif all(bound in Listing.PRICE_BUCKETS for bound in bounds):
+        version = (caching.catalog_version(), caching.prices_version())
+    else:
+        # Any bid may take a listing across a bound inside a bucket.
+        version = (caching.feed_version(),)
+    query = query_string(filters)
+    counts = caching.cached_value(
+        ("facets", *version, query),
+        lambda: [count_categories(filters), count_currencies(filters)])
+    prices = caching.cached_value(
+        ("price-facet", caching.catalog_version(), caching.prices_version(),
+         query),
+        lambda: count_prices(filters))
+
+    def without(*names):
+        return query_string(
+            {k: v for k, v in filters.items() if k not in names})
+
+    return [
+        {"name": "Category", "any": without("category"),
+         "options": options(filters, counts[0])},
+        {"name": "Currency", "any": without("currency"),
+         "options": options(filters, counts[1])},
+        {"name": "Price", "any": without("min_price", "max_price"),
+         "options": options(filters, prices)},
+    ]
+
+
+def options(filters, counts):
+    """Turn (label, count, choice) tuples into links narrowing ``filters``."""
+    result = []
+    for label, count, choice in counts:
+        narrowed = {**filters, **choice}
+        result.append({
+            "label": label,
+            "count": count,
+            "selected": all(filters.get(k) == v for k, v in choice.items()),
+            "query": query_string(
+                {k: v for k, v in narrowed.items() if v is not None}),
+        })
+    return result
+
+
+def count_categories(filters):
+    # Grouping on the bare column is a scan of the category index; the
+    # names come from the small category table.
+    counts = dict(Listing.objects.filter(
+        listing_filter(filters, "category")).order_by().values_list(
+            "category").annotate(count=Count("id")))
+    names = Category.objects.filter(id__in=counts).values_list("id", "name")
+    return sorted(((name, counts[id], {"category": id}) for id, name in names),
+                  key=lambda option: option[0])
+
+
+def count_currencies(filters):
+    return [
+        (currency, count, {"currency": currency})
+        for currency, count in Listing.objects.filter(
+            listing_filter(filters, "currency")).order_by().values_list(
+                "currency").annotate(count=Count("id")).order_by("currency")
+    ]
+
+
+def count_prices(filters):
+    # Grouping on the bucket column reads a facet index in bucket order.
+    counts = dict(Listing.objects.filter(
+        listing_filter(filters, "price")).order_by().values_list(
+            "price_bucket").annotate(count=Count("id")))
+    ranges = [
+        (float(low), float(high) if high is not None else None)
+        for low, high in zip(Listing.PRICE_BUCKETS,
+                             Listing.PRICE_BUCKETS[1:] + [None])
+    ]
+    return [
+        (f"{low:g}–{high:g}" if high is not None else f"{low:g}+",
+         counts[n], {"min_price": low, "max_price": high})
+        for n, (low, high) in enumerate(ranges) if counts.get(n)
+    ]
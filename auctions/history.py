@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.db.models import Max, Min
+
+from .models import Bid
+from .pagination import keyset_page
+
+CHUNK_SIZE = 2000
+
+
+def bid_page(item_id, cursor=None, per_page=50):
+    """Return (bids, next_cursor) for a newest-first page of bid history.
+
+    Bids only ever raise the price, so the highest bids are the newest,
+    and paging on the amount walks the (item, bid) index.
+    """
+    return keyset_page(
+        Bid.objects.filter(item=item_id).select_related("bid_by").only(
+            "bid", "created", "bid_by__username"),
+        cursor, per_page, fields=("bid", "id"))
+
+
+def price_history(item_id, points=200):
+    """Downsample a listing's bids into at most ``points`` time buckets.
+
+    The time between the first and the last bid is split into equal
+    buckets. Each non-empty one becomes a point with its start time, the
+    price it closed at and the number of bids in it. Returns the bucket
+    width in seconds and the points, oldest first. Bids are streamed in
+    index order, so memory use does not depend on how many there are.
+    """
+    bids = Bid.objects.filter(item=item_id)
+    span = bids.aggregate(start=Min("created"), end=Max("created"))
+    if span["start"] is None:
+        return 0, []
+    width = (span["end"] - span["start"]) / points or timedelta(seconds=1)
+
+    buckets = []
+    for created, bid in bids.order_by("bid", "id").values_list(
+            "created", "bid").iterator(chunk_size=CHUNK_SIZE):
+        n = min(int((created - span["start"]) / width), points - 1)
+        # Clocks of concurrent bidders can be slightly out of order.
+        if buckets and n <= buckets[-1][0]:
+            buckets[-1][1] = bid
+            buckets[-1][2] += 1
+        else:
+            buckets.append([n, bid, 1])
+
+    return width.total_seconds(), [
+        {"time": span["start"] + n * width, "price": price, "bids": count}
+        for n, price, count in buckets
+    ]
@@ -0,0 +1,271 @@
+import hashlib
+import http.client
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from .images import FORMATS, VARIANTS, encode, open_image
+
+SALT = "auctions.image_proxy"
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+MAX_REDIRECTS = 3
+REDIRECTS = {301, 302, 303, 307, 308}
+
+
+class FetchError(Exception):
+    pass
+
+
+def resolve(host, port):
+    """Return the IP addresses ``host`` resolves to."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as e:
+        raise FetchError(f"Cannot resolve {host}: {e}") from e
+    return [info[4][0] for info in infos]
+
+
+def public_address(url):
+    """Return (host, port, address) to fetch ``url`` from.
+
+    Only http and https are allowed, and every address of the host must
+    be public: loopback, private, link-local (which includes the cloud
+    metadata service), reserved and multicast ones are refused.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"Refusing to fetch {url}")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError as e:
+        raise FetchError(f"Refusing to fetch {url}") from e
+    addresses = resolve(parts.hostname, port)
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if getattr(ip, "ipv4_mapped", None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise FetchError(f"Refusing to fetch {url}: {ip} is not public")
+    if not addresses:
+        raise FetchError(f"Cannot resolve {parts.hostname}")
+    return parts.hostname, port, addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to an address checked beforehand, not to a new lookup."""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection(
+            (self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        # The certificate is still checked against the host name.
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def fetch_url(url, timeout=5):
+    """Download ``url``; the default IMAGE_PROXY_FETCHER.
+
+    Each hop, redirects included, is checked by public_address() and
+    connected to the address that was checked, so DNS answers that change
+    in between cannot point it at an internal host.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        host, port, address = public_address(url)
+        parts = urlsplit(url)
+        connection_class = PinnedHTTPSConnection \
+            if parts.scheme == "https" else PinnedHTTPConnection
+        connection = connection_class(
+            host, address, port=port, timeout=timeout)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        try:
+            connection.request("GET", path, headers={"Host": parts.netloc})
+            response = connection.getresponse()
+            if response.status in REDIRECTS and response.getheader("Location"):
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status != 200:
+                raise FetchError(f"Fetching {url} failed: {response.status}")
+            data = response.read(MAX_SOURCE_BYTES + 1)
+        except (OSError, http.client.HTTPException) as e:
+            raise FetchError(f"Fetching {url} failed: {e}") from e
+        finally:
+            connection.close()
+        if len(data) > MAX_SOURCE_BYTES:
+            raise FetchError(f"{url} is larger than {MAX_SOURCE_BYTES} bytes")
+        return data
+    raise FetchError(f"Too many redirects fetching {url}")
+
+
+def get_fetcher():
+    return import_string(getattr(
+        settings, "IMAGE_PROXY_FETCHER", "auctions.image_proxy.fetch_url"))
+
+
+def is_proxyable(url):
+    return urlsplit(url).scheme in ("http", "https")
+
+
+def proxy_url(url, variant):
+    """Return the local URL that serves ``url`` shrunk to ``variant``.
+
+    The remote URL is signed, so the endpoint cannot be used to make the
+    server fetch arbitrary addresses. Sellers choose image_url, though, so
+    fetch_url() still refuses hosts that are not public.
+    """
+    signature = signing.Signer(salt=SALT).signature(url)
+    return "%s?%s" % (reverse("image_proxy", args=[variant]),
+                      urlencode({"url": url, "sig": signature}))
+
+
+def check_signature(url, signature):
+    return constant_time_compare(
+        signing.Signer(salt=SALT).signature(url), signature)
+
+
+class DiskCache:
+    """A directory of files evicted least recently used first.
+
+    Reading a file bumps its modification time; when a write takes the
+    directory past ``max_bytes``, the files with the oldest times are
+    removed. Concurrent misses on the same key are coalesced, so only one
+    thread produces each file while the others wait for its result.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending = {}
+        os.makedirs(path, exist_ok=True)
+
+    def read(self, name):
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def write(self, name, data):
+        fd, temp = tempfile.mkstemp(dir=self.path, prefix=".")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp, os.path.join(self.path, name))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_create(self, name, produce):
+        """Return the cached ``name``, calling ``produce()`` on a miss."""
+        data = self.read(name)
+        if data is not None:
+            return data
+
+        with self.lock:
+            future = self.pending.get(name)
+            leader = future is None
+            if leader:
+                future = self.pending[name] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            data = self.read(name)
+            if data is None:
+                data = produce()
+                self.write(name, data)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self.lock:
+                del self.pending[name]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        path = settings.IMAGE_PROXY_CACHE_DIR
+        max_bytes = getattr(settings, "IMAGE_PROXY_CACHE_BYTES", 256 << 20)
+        if _cache is None or (_cache.path, _cache.max_bytes) != (
+                path, max_bytes):
+            _cache = DiskCache(path, max_bytes)
+        return _cache
+
+
+def proxied_image(url, variant, format):
+    """Return ``url`` shrunk to ``variant`` and encoded as ``format``.
+
+    The original is downloaded at most once while it stays in the cache;
+    every size and format is then rendered from the cached copy.
+    """
+    if variant not in VARIANTS or format not in FORMATS:
+        raise ValueError(f"Unknown image variant: {variant}.{format}")
+    cache = get_cache()
+    key = hashlib.sha256(url.encode()).hexdigest()
+
+    def render():
+        source = cache.get_or_create(f"{key}.src", lambda: get_fetcher()(url))
+        try:
+            return encode(open_image(source), variant, format)
+        except OSError as e:
+            raise FetchError(f"{url} is not an image: {e}") from e
+        except Image.DecompressionBombError as e:
+            raise FetchError(f"{url} is too large: {e}") from e
+
+    return cache.get_or_create(f"{key}-{variant}.{format}", render)
@@ -0,0 +1,114 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from .caching import listings_changed
+from .models import Listing
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box; images are shrunk to fit, never enlarged.
+VARIANTS = {
+    "thumb": (300, 300),
+    "detail": (1200, 1200),
+}
+
+FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True,
+             "progressive": True},
+}
+
+VARIANT_DIR = "uploads/variants"
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "IMAGE_PIPELINE_WORKERS", 2),
+    thread_name_prefix="listing-images")
+
+
+def open_image(data):
+    """Decode an image, refusing ones over IMAGE_MAX_PIXELS.
+
+    A small file can declare a huge size, and decoding allocates memory
+    for every pixel, so the size is checked from the header first. Raises
+    OSError for data that is not an image and Image.DecompressionBombError
+    for images that are too large.
+    """
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if width * height > getattr(settings, "IMAGE_MAX_PIXELS", 50_000_000):
+        raise Image.DecompressionBombError(
+            f"{width}x{height} pixels is too large")
+    return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def encode(image, variant, format):
+    """Return ``image`` shrunk to fit ``variant``, encoded as ``format``."""
+    image = image.copy()
+    image.thumbnail(VARIANTS[variant], Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, **FORMATS[format])
+    return out.getvalue()
+
+
+def render_variants(data):
+    """Yield (variant, format, file name, encoded bytes) for an image.
+
+    File names start with a hash of the source image, so they never need
+    to change once published and can be cached forever. They are relative
+    to VARIANT_DIR.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    source = open_image(data)
+    for variant in VARIANTS:
+        for format in FORMATS:
+            yield variant, format, f"{digest}-{variant}.{format}", \
+                encode(source, variant, format)
+
+
+def process_listing_image(listing_id):
+    """Generate and store the variants of a listing's uploaded image."""
+    listing = Listing.objects.filter(id=listing_id).only("image").first()
+    if listing is None or not listing.image:
+        return
+    with listing.image.open("rb") as f:
+        data = f.read()
+
+    variants = {}
+    try:
+        for variant, format, name, content in render_variants(data):
+            path = f"{VARIANT_DIR}/{name}"
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(content))
+            variants.setdefault(variant, {})[format] = name
+    except (OSError, Image.DecompressionBombError) as e:
+        # Pages keep showing the original upload.
+        logger.warning("Image of listing %s cannot be resized: %s",
+                       listing_id, e)
+        return
+    # update() rather than save(): saving this .only("image") copy would
+    # also write back the image it was loaded with, which may have been
+    # replaced meanwhile.
+    Listing.objects.filter(id=listing_id).update(image_variants=variants)
+    listings_changed(listing_id)
+
+
+def _run(listing_id):
+    try:
+        process_listing_image(listing_id)
+    except Exception:
+        logger.exception("Processing image of listing %s failed", listing_id)
+    finally:
+        connection.close()
+
+
+def schedule(listing_id):
+    """Process a listing's image on the worker pool."""
+    return executor.submit(_run, listing_id)
@@ -0,0 +1,133 @@
+import csv
+import hashlib
+import io
+import json
+from itertools import islice
+
+from django import forms
+from django.db import transaction
+
+from .caching import listings_changed
+from .models import Category, Listing, ListingImport
+from .views import NewListingForm
+
+FORMATS = ["csv", "jsonl"]
+
+
+class ImportListingForm(NewListingForm):
+    """NewListingForm rules, with the category given by name.
+
+    Categories are resolved for a whole batch at once instead of through
+    one ModelChoiceField lookup per row.
+    """
+    category = forms.CharField(max_length=64)
+
+    class Meta(NewListingForm.Meta):
+        fields = ["item", "description", "price", "currency", "image_url"]
+
+
+def checksum(file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(1 << 16), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def read_rows(file, format):
+    """Yield (line number, row dict) pairs from a binary CSV or JSONL file.
+
+    Rows that cannot even be parsed are yielded with a None row.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "jsonl":
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unknown format: {format}")
+    text.detach()
+
+
+def resolve_categories(names):
+    """Map category names to Category rows, creating the missing ones."""
+    categories = {c.name: c for c in Category.objects.filter(name__in=names)}
+    missing = set(names) - set(categories)
+    if missing:
+        Category.objects.bulk_create([Category(name=n) for n in missing])
+        categories.update(
+            (c.name, c) for c in Category.objects.filter(name__in=missing))
+    return categories
+
+
+def describe_errors(errors):
+    return "; ".join(
+        f"{field}: {error['message']}"
+        for field, field_errors in errors.items() for error in field_errors)
+
+
+def import_listings(file, name, seller, format, batch_size=1000):
+    """Import listings from ``file`` for ``seller``, resuming a previous run.
+
+    Rows are validated with the listing form rules; valid ones are inserted
+    with bulk_create, one transaction per batch that also advances the
+    ListingImport checkpoint, so a crash loses at most the batch in flight.
+    Returns the ListingImport and a list of (line number, errors) for the
+    rows rejected during this run.
+    """
+    state, _ = ListingImport.objects.get_or_create(
+        checksum=checksum(file), seller=seller, defaults={"name": name})
+    rejects = []
+    if state.finished:
+        return state, rejects
+
+    rows = ((n, row) for n, row in read_rows(file, format)
+            if n > state.lines_done)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        valid = []
+        for number, row in batch:
+            if row is None:
+                rejects.append((number, {"__all__": [
+                    {"message": "Unreadable row.", "code": "invalid"}]}))
+                continue
+            form = ImportListingForm(row)
+            if form.is_valid():
+                valid.append(form)
+            else:
+                rejects.append((number, form.errors.get_json_data()))
+
+        with transaction.atomic():
+            categories = resolve_categories(
+                {f.cleaned_data["category"] for f in valid})
+            listings = []
+            for form in valid:
+                listing = form.save(commit=False)
+                listing.category = categories[form.cleaned_data["category"]]
+                listing.created_by = state.seller
+                listing.current_price = listing.price
+                listing.price_bucket = Listing.bucket_of(listing.price)
+                listings.append(listing)
+            Listing.objects.bulk_create(listings)
+            listings_changed(catalog=True)
+
+            state.lines_done = batch[-1][0]
+            state.imported += len(listings)
+            state.rejected += len(batch) - len(listings)
+            state.save()
+
+    state.finished = True
+    state.save(update_fields=["finished"])
+    return state, rejects
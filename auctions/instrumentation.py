@@ -0,0 +1,121 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates
+
+# Stats of the request being handled by the current thread or task.
+current_stats = ContextVar("current_stats", default=None)
+
+
+class RequestStats:
+    """Query and template timings collected while serving one request.
+
+    Queries reach ``__call__`` through ``instrument_queries``, possibly from
+    several threads at once when an async view runs reads concurrently.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slowest_sql = None
+        self.slowest_sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                self.sql_time += duration
+                if duration >= self.slowest_sql_time:
+                    self.slowest_sql, self.slowest_sql_time = sql, duration
+
+
+def instrument_queries(execute, sql, params, many, context):
+    """Execute wrapper reporting to the stats of the current request, if any.
+
+    The stats are found through a context variable rather than the
+    connection, so queries an async view runs in worker threads, each on
+    its own connection, are still counted against the request.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_instrumentation(sender, connection, **kwargs):
+    # Inserted first: execute_wrapper() pops wrappers from the end.
+    if instrument_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, instrument_queries)
+
+
+class RollingStats:
+    """Keeps the last ``window`` samples per URL name for percentiles."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, url_name, total_ms, sql_ms, queries):
+        with self.lock:
+            self.samples[url_name].append((total_ms, sql_ms, queries))
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        with self.lock:
+            snapshot = {name: list(s) for name, s in self.samples.items()}
+
+        summary = {}
+        for name, samples in snapshot.items():
+            summary[name] = {"count": len(samples)}
+            for i, metric in enumerate(["total_ms", "sql_ms", "queries"]):
+                values = sorted(sample[i] for sample in samples)
+                summary[name][metric] = {
+                    f"p{p}": percentile(values, p) for p in (50, 95, 99)
+                }
+        return summary
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend that reports render time to RequestStats."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
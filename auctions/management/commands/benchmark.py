@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from auctions.instrumentation import percentile
+from auctions.models import Category, Listing, User
+from auctions.seeding import seed_dataset
+
+ROUTES = ["index", "listing", "category", "watchlist", "bid"]
+
+# URL names serving each route on the async read path.
+ASYNC_ROUTES = {
+    "index": "async_index",
+    "listing": "async_listing",
+    "category": "async_category",
+    "watchlist": "async_watchlist",
+    "bid": "bid",
+}
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset, then load the main views through the "
+        "Django test client (WSGI) and/or async client (ASGI) and report "
+        "latency percentiles as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-seed", action="store_true",
+                            help="Benchmark the data already in the database.")
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--listings", type=int, default=10000)
+        parser.add_argument("--bids-per-listing", type=int, default=5)
+        parser.add_argument("--comments-per-listing", type=int, default=5)
+        parser.add_argument("--watchlist-per-user", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--requests", type=positive_int, default=200,
+                            help="Requests per route.")
+        parser.add_argument("--concurrency", type=positive_int, default=4)
+        parser.add_argument("--routes", nargs="+", choices=ROUTES,
+                            default=ROUTES)
+        parser.add_argument("--interface", choices=["wsgi", "asgi", "both"],
+                            default="wsgi",
+                            help="asgi serves reads through the async views.")
+        parser.add_argument("--output", help="Also write the report here.")
+
+    def handle(self, *args, **options):
+        report = {"concurrency": options["concurrency"]}
+        if not options["skip_seed"]:
+            start = time.perf_counter()
+            report["dataset"] = seed_dataset(
+                users=options["users"],
+                categories=options["categories"],
+                listings=options["listings"],
+                bids_per_listing=options["bids_per_listing"],
+                comments_per_listing=options["comments_per_listing"],
+                watchlist_per_user=options["watchlist_per_user"],
+                batch_size=options["batch_size"],
+            )
+            report["seed_seconds"] = round(time.perf_counter() - start, 3)
+
+        users = list(User.objects.order_by("-id")[:options["concurrency"]])
+        listing_ids = list(Listing.objects.filter(closed=False).order_by(
+            "-id").values_list("id", flat=True)[:1000])
+        category_ids = list(Category.objects.values_list("id", flat=True))
+        if not users or not listing_ids or not category_ids:
+            self.stderr.write("Nothing to benchmark; seed some data first.")
+            return
+
+        # Strictly increasing amounts, so bids only lose to a racing bid.
+        amounts = itertools.count(10 ** 9)
+
+        def requests(names):
+            return {
+                "index": lambda rng: ("get", reverse(names["index"]), None),
+                "listing": lambda rng: ("get", reverse(
+                    names["listing"], args=[rng.choice(listing_ids)]), None),
+                "category": lambda rng: ("get", reverse(
+                    names["category"], args=[rng.choice(category_ids)]), None),
+                "watchlist": lambda rng: (
+                    "get", reverse(names["watchlist"]), None),
+                "bid": lambda rng: ("post", reverse(names["bid"]), {
+                    "item": rng.choice(listing_ids), "bid": next(amounts)}),
+            }
+
+        interfaces = {
+            "wsgi": ("routes", requests({r: r for r in ROUTES}),
+                     self.run_route),
+            "asgi": ("asgi_routes", requests(ASYNC_ROUTES),
+                     self.run_route_async),
+        }
+        selected = ["wsgi", "asgi"] if options["interface"] == "both" \
+            else [options["interface"]]
+        # The test clients always send Host: testserver.
+        with override_settings(
+                ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ["testserver"]):
+            for interface in selected:
+                key, make_requests, run = interfaces[interface]
+                report[key] = {
+                    route: run(make_requests[route], users,
+                               options["requests"], options["concurrency"])
+                    for route in options["routes"]
+                }
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+    def run_route(self, make_request, users, total, concurrency):
+        """Send ``total`` requests from ``concurrency`` threads over WSGI."""
+        lock = threading.Lock()
+        remaining = iter(range(total))
+        latencies, queries, statuses = [], [], Counter()
+
+        def worker(n):
+            client = Client(raise_request_exception=False)
+            client.force_login(users[n % len(users)])
+            rng = random.Random(n)
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    method, url, data = make_request(rng)
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        status = getattr(client, method)(url, data).status_code
+                        elapsed = time.perf_counter() - start
+                    with lock:
+                        statuses[status] += 1
+                        if status < 400:
+                            latencies.append(elapsed * 1000)
+                            queries.append(len(captured))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return summarize(latencies, queries, statuses,
+                         time.perf_counter() - start)
+
+    def run_route_async(self, make_request, users, total, concurrency):
+        """Send ``total`` requests from ``concurrency`` tasks over ASGI.
+
+        Reads on the async path run in worker threads, so query counts are
+        taken from the Server-Timing header of PerformanceMiddleware.
+        """
+        clients = []
+        for n in range(concurrency):
+            client = AsyncClient(raise_request_exception=False)
+            client.force_login(users[n % len(users)])
+            clients.append(client)
+        remaining = iter(range(total))
+        latencies, queries, statuses = [], [], Counter()
+
+        async def worker(n):
+            rng = random.Random(n)
+            while next(remaining, None) is not None:
+                method, url, data = make_request(rng)
+                kwargs = {}
+                if method == "post":
+                    # Django 3.2's AsyncClient cannot read back the
+                    # multipart bodies it builds from dicts.
+                    data = urlencode(data)
+                    kwargs["content_type"] = \
+                        "application/x-www-form-urlencoded"
+                start = time.perf_counter()
+                response = await getattr(clients[n], method)(
+                    url, data, **kwargs)
+                elapsed = time.perf_counter() - start
+                statuses[response.status_code] += 1
+                if response.status_code >= 400:
+                    continue
+                latencies.append(elapsed * 1000)
+                match = re.search(r'desc="(\d+) queries"',
+                                  response.get("Server-Timing", ""))
+                if match:
+                    queries.append(int(match.group(1)))
+
+        async def run():
+            await asyncio.gather(*[worker(n) for n in range(concurrency)])
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        return summarize(latencies, queries, statuses,
+                         time.perf_counter() - start)
+
+
+def summarize(latencies, queries, statuses, wall):
+    """Report a run from the latencies and query counts of the requests
+    that succeeded and the statuses of all of them.
+
+    Failed requests only show up in ``statuses``, so that fast errors
+    never pass for fast responses.
+    """
+    latencies.sort()
+
+    def ms(p):
+        # Nothing is timed when, say, benchmark_writes runs --writes 0.
+        return round(percentile(latencies, p), 3) if latencies else None
+
+    return {
+        "requests": sum(statuses.values()),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": ms(50),
+        "p95_ms": ms(95),
+        "p99_ms": ms(99),
+        "queries_per_request":
+            round(sum(queries) / len(queries), 2) if queries else None,
+    }
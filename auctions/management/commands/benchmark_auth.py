@@ -0,0 +1,64 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from auctions.management.commands import benchmark
+from auctions.models import User
+
+SESSIONS = "django.contrib.sessions.backends."
+
+CONFIGURATIONS = {
+    "before": {
+        "SESSION_ENGINE": SESSIONS + "db",
+        "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+    },
+    "cached_db": {
+        "SESSION_ENGINE": SESSIONS + "cached_db",
+        "AUTHENTICATION_BACKENDS": ["auctions.auth.CachedModelBackend"],
+    },
+    "signed_cookies": {
+        "SESSION_ENGINE": SESSIONS + "signed_cookies",
+        "AUTHENTICATION_BACKENDS": ["auctions.auth.CachedModelBackend"],
+    },
+}
+
+
+class Command(benchmark.Command):
+    help = (
+        "Load the index page as signed-in users with database sessions and "
+        "users, then with cached_db and signed-cookie sessions and cached "
+        "users, and report latency percentiles and queries as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=benchmark.positive_int,
+                            default=500)
+        parser.add_argument("--concurrency", type=benchmark.positive_int,
+                            default=4)
+        parser.add_argument("--output", help="Also write the report here.")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by("-id")[:options["concurrency"]])
+        if not users:
+            self.stderr.write("Nothing to benchmark; seed some data first.")
+            return
+
+        report = {"concurrency": options["concurrency"]}
+        request = lambda rng: ("get", reverse("index"), None)  # noqa: E731
+        for name, config in CONFIGURATIONS.items():
+            cache.clear()
+            with override_settings(
+                    ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ["testserver"],
+                    **config):
+                report[name] = self.run_route(
+                    request, users, options["requests"],
+                    options["concurrency"])
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
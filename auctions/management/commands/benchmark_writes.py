@@ -0,0 +1,145 @@
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.test.utils import override_settings
+
+from auctions.bidding import place_bid
+from auctions.database import is_lock_error, retry_on_lock
+from auctions.management.commands.benchmark import summarize
+from auctions.models import Comment, Listing, User
+
+# SQLite as Django opens it by default: rollback journal, no retries.
+# journal_mode is stored in the database file, so it has to be reset.
+BASELINE = {"SQLITE_PRAGMAS": {"journal_mode": "delete"},
+            "SQLITE_LOCK_RETRIES": 0}
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a few listings with concurrent bids and comments while "
+        "other threads read them, once with SQLite's defaults and once "
+        "with the configured pragmas and lock retries, and report write "
+        "throughput and errors as JSON. WAL is only configured in "
+        "production, or with COMMERCE_SQLITE_WAL=1. Writes into the "
+        "configured database, so point it at a scratch copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writes", type=int, default=200,
+                            help="Writes per writer thread.")
+        parser.add_argument("--listings", type=int, default=10,
+                            help="Number of open listings to contend on.")
+        parser.add_argument("--output", help="Also write the report here.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stderr.write("This benchmark is about SQLite locking.")
+            return
+        listing_ids = list(Listing.objects.filter(closed=False).order_by(
+            "-id").values_list("id", flat=True)[:options["listings"]])
+        users = list(User.objects.order_by("-id")[:options["writers"]])
+        if not listing_ids or not users:
+            self.stderr.write("Nothing to benchmark; seed some data first.")
+            return
+
+        report = {key: options[key]
+                  for key in ["writers", "readers", "writes", "listings"]}
+        # Strictly increasing amounts, so bids only lose to a racing bid.
+        amounts = itertools.count(10 ** 9)
+        runs = [("before", override_settings(**BASELINE)),
+                ("after", override_settings())]
+        for name, settings in runs:
+            connections.close_all()
+            with settings:
+                report[name] = self.run(listing_ids, users, amounts, options)
+            connections.close_all()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+    def run(self, listing_ids, users, amounts, options):
+        lock = threading.Lock()
+        latencies, statuses = [], Counter()
+        reads = [0]
+        done = threading.Event()
+        comment = retry_on_lock(Comment.objects.create)
+
+        def write(n, i):
+            item_id = listing_ids[(n + i) % len(listing_ids)]
+            if i % 2:
+                comment(item_id=item_id, content=f"Comment {i}",
+                        created_by=users[n % len(users)])
+                return "ok"
+            with lock:
+                amount = next(amounts)
+            accepted = place_bid(item_id, users[n % len(users)], amount)
+            return "ok" if accepted else "rejected"
+
+        def writer(n):
+            try:
+                for i in range(options["writes"]):
+                    start = time.perf_counter()
+                    try:
+                        status = write(n, i)
+                    except Exception as e:
+                        if not is_lock_error(e):
+                            raise
+                        status = "locked"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed * 1000)
+                        statuses[status] += 1
+            finally:
+                connection.close()
+
+        def reader():
+            try:
+                while not done.is_set():
+                    try:
+                        with transaction.atomic():
+                            list(Listing.objects.filter(id__in=listing_ids)
+                                 .values("current_price", "bid_count"))
+                            Comment.objects.filter(
+                                item__in=listing_ids).count()
+                    except Exception as e:
+                        if not is_lock_error(e):
+                            raise
+                    with lock:
+                        reads[0] += 1
+            finally:
+                connection.close()
+
+        writers = [threading.Thread(target=writer, args=(n,))
+                   for n in range(options["writers"])]
+        readers = [threading.Thread(target=reader)
+                   for _ in range(options["readers"])]
+        start = time.perf_counter()
+        for t in writers + readers:
+            t.start()
+        for t in writers:
+            t.join()
+        wall = time.perf_counter() - start
+        done.set()
+        for t in readers:
+            t.join()
+
+        result = summarize(latencies, [], statuses, wall)
+        result["journal_mode"] = self.journal_mode()
+        result["reads_per_second"] = round(reads[0] / wall, 2)
+        del result["queries_per_request"]
+        return result
+
+    def journal_mode(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
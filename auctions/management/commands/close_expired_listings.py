@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from auctions.expiry import close_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Close listings whose end time has passed and record their winners, "
+        "in batches. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--interval", type=float, default=30,
+                            help="Seconds to sleep between sweeps.")
+        parser.add_argument("--once", action="store_true",
+                            help="Sweep once and exit.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                closed = close_expired(batch_size=options["batch_size"])
+                if closed or options["once"]:
+                    self.stdout.write(f"Closed {closed} expired listings.")
+                if options["once"]:
+                    return
+                # Do not hold a connection open while idle.
+                connection.close()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.exports import (
+    CONTENT_TYPES, EXPORTS, InvalidExport, export_rows, parse_filters,
+    render_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream listings, bids or comments as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument("--format", choices=list(CONTENT_TYPES),
+                            default="ndjson")
+        parser.add_argument("--category", help="Category id.")
+        parser.add_argument("--closed", help="true or false.")
+        parser.add_argument("--since", help="ISO date or datetime, inclusive.")
+        parser.add_argument("--until", help="ISO date or datetime, exclusive.")
+        parser.add_argument("--output", help="File to write instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_rows(options["kind"], **parse_filters(options))
+            lines = render_rows(options["kind"], rows, options["format"])
+        except InvalidExport as e:
+            raise CommandError(e)
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
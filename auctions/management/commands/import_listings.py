@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.imports import FORMATS, describe_errors, import_listings
+from auctions.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import listings from a CSV or JSONL file. Running the command "
+        "again on the same file for the same seller resumes after the last "
+        "committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--seller", required=True,
+                            help="Username the listings are created by.")
+        parser.add_argument("--format", choices=FORMATS,
+                            help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or os.path.splitext(path)[1].lstrip(".")
+        if format not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {path}; use --format.")
+        try:
+            seller = User.objects.get(username=options["seller"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['seller']}.")
+
+        with open(path, "rb") as f:
+            state, rejects = import_listings(
+                f, os.path.basename(path), seller, format,
+                options["batch_size"])
+
+        for line, errors in rejects:
+            self.stderr.write(f"Line {line}: {describe_errors(errors)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{state.imported} listings imported, {state.rejected} rows "
+            f"rejected from {state.name}."))
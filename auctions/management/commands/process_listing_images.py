@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from auctions.images import process_listing_image
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnail and detail variants of listing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Also redo listings that already have variants.")
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.exclude(image="")
+        if not options["all"]:
+            listings = listings.filter(image_variants={})
+        processed = 0
+        for id in listings.values_list("id", flat=True).iterator():
+            process_listing_image(id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images."))
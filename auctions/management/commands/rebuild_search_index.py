@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text listing search index."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search requires SQLite with FTS5.")
+
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} listings."))
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .instrumentation import RequestStats, RollingStats, current_stats
+
+logger = logging.getLogger("auctions.performance")
+
+rolling_stats = RollingStats(getattr(settings, "PERFORMANCE_STATS_WINDOW", 1000))
+
+
+class PerformanceMiddleware(MiddlewareMixin):
+    """Measure queries, SQL time, template time and total time per request.
+
+    The numbers are sent back in a Server-Timing header, fed into the
+    per-URL-name rolling percentiles served by the ``performance_stats``
+    view, and logged with the slowest query when the request took longer
+    than PERFORMANCE_SLOW_REQUEST_MS. Works in front of both sync and async
+    views.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.slow_request_ms = getattr(
+            settings, "PERFORMANCE_SLOW_REQUEST_MS", 500)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.report(request, response, stats, start)
+
+    def report(self, request, response, stats, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = stats.sql_time * 1000
+        template_ms = stats.template_time * 1000
+
+        response["Server-Timing"] = ", ".join([
+            f'sql;dur={sql_ms:.2f};desc="{stats.queries} queries"',
+            f"template;dur={template_ms:.2f}",
+            f"total;dur={total_ms:.2f}",
+        ])
+
+        match = request.resolver_match
+        url_name = match.url_name if match and match.url_name else "unresolved"
+        rolling_stats.record(url_name, total_ms, sql_ms, stats.queries)
+
+        if total_ms > self.slow_request_ms:
+            logger.warning(
+                "Slow request %s %s (%s): %.1fms total, %.1fms in %d queries,"
+                " %.1fms rendering templates; slowest query (%.1fms): %s",
+                request.method, request.path, url_name, total_ms, sql_ms,
+                stats.queries, template_ms, stats.slowest_sql_time * 1000,
+                stats.slowest_sql)
+        return response
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_current_price(apps, schema_editor):
+    Bid = apps.get_model("auctions", "Bid")
+    Listing = apps.get_model("auctions", "Listing")
+
+    top_bids = Bid.objects.filter(item=OuterRef("pk")).order_by("-bid", "id")
+    bid_counts = (
+        Bid.objects.filter(item=OuterRef("pk"))
+        .order_by()
+        .values("item")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Listing.objects.update(
+        current_price=Coalesce(
+            Subquery(top_bids.values("bid")[:1]), F("price")),
+        top_bidder=Subquery(top_bids.values("bid_by")[:1]),
+        bid_count=Coalesce(Subquery(bid_counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auctions', '0017_auto_20201022_0529'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.FloatField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='top_bidder',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_current_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0018_listing_current_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['closed', '-created', '-id'], name='listing_feed_idx'),
+        ),
+    ]
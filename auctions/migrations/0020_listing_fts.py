@@ -0,0 +1,49 @@
+from django.db import migrations
+
+FTS_TABLE = "auctions_listing_fts"
+
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"item, description, content='auctions_listing', content_rowid='id')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}(rowid, item, description)"
+    f" VALUES (new.id, new.item, new.description); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, item, description)"
+    f" VALUES ('delete', old.id, old.item, old.description); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF item, description"
+    f" ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, item, description)"
+    f" VALUES ('delete', old.id, old.item, old.description);"
+    f" INSERT INTO {FTS_TABLE}(rowid, item, description)"
+    f" VALUES (new.id, new.item, new.description); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains.
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0019_listing_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0021_listingimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['item', '-created', '-id'], name='comment_item_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Watchlist = apps.get_model("auctions", "Watchlist")
+    keep = Watchlist.objects.values("user", "item").annotate(
+        first=Min("id")).values("first")
+    Watchlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_listing_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='watchlist_user_item_uniq'),
+        ),
+    ]
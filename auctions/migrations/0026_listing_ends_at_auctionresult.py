@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0025_listing_open_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuctionResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.FloatField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['ends_at'], name='listing_open_ends_idx'),
+        ),
+        migrations.AddField(
+            model_name='auctionresult',
+            name='listing',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result', to='auctions.listing'),
+        ),
+        migrations.AddField(
+            model_name='auctionresult',
+            name='winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='auctionresult',
+            name='winning_bid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='auctions.bid'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0026_listing_ends_at_auctionresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('maximum', models.FloatField()),
+                ('placed', models.DateTimeField(auto_now=True)),
+                ('bidder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='proxybid',
+            index=models.Index(fields=['item', '-maximum', 'placed'], name='proxybid_item_maximum_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='proxybid',
+            constraint=models.UniqueConstraint(fields=('item', 'bidder'), name='proxybid_item_bidder_uniq'),
+        ),
+    ]
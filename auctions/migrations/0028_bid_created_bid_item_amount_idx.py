@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0027_proxybid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['item', 'bid'], name='bid_item_amount_idx'),
+        ),
+    ]
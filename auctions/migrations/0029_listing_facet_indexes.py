@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0028_bid_created_bid_item_amount_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['currency', '-created', '-id'], name='listing_currency_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['current_price'], name='listing_price_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', 'currency', 'current_price', 'closed'], name='listing_facet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', True)), fields=['-created', '-id'], name='listing_closed_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0029_listing_facet_indexes'),
+    ]
+
+    # auto_now_add only changes what Django writes, not the column, so
+    # there is no need to have SQLite copy both tables.
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='comment',
+                name='created',
+                field=models.DateTimeField(auto_now_add=True),
+            ),
+            migrations.AlterField(
+                model_name='listing',
+                name='created',
+                field=models.DateTimeField(auto_now_add=True),
+            ),
+        ]),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0030_created_auto_now_add'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listingimport',
+            name='checksum',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='listingimport',
+            constraint=models.UniqueConstraint(fields=('checksum', 'seller'), name='listingimport_checksum_seller_uniq'),
+        ),
+    ]
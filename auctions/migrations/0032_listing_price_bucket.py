@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+def backfill_price_bucket(apps, schema_editor):
+    Listing = apps.get_model("auctions", "Listing")
+    # The lower bounds of Listing.PRICE_BUCKETS when this was written.
+    for bucket, low in enumerate([10, 50, 100, 500, 1000], 1):
+        Listing.objects.filter(current_price__gte=low).update(
+            price_bucket=bucket)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0031_listingimport_checksum_seller_uniq'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_price_open_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_facet_idx',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='price_bucket',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_price_bucket, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['price_bucket', '-created', '-id'], name='listing_price_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['price_bucket', 'category', 'currency', 'current_price', 'closed'], name='listing_price_facet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('closed', False)), fields=['currency', 'price_bucket', 'category', 'current_price', 'closed'], name='listing_currency_facet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', 'currency', 'price_bucket', 'current_price', 'closed'], name='listing_facet_idx'),
+        ),
+    ]
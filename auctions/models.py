@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
@@ -23,8 +25,76 @@ class Listing(models.Model):
     description = models.TextField(max_length=256, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     closed = models.BooleanField(default=False)
-    created = models.DateTimeField(auto_now=True)
+    created = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # When set, auctions.expiry closes the listing once this has passed.
+    ends_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by the bid view so pages never have to scan Bid rows.
+    current_price = models.FloatField(editable=False)
+    top_bidder = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        editable=False, related_name="leading_listings")
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+    # {"thumb": {"webp": name, "jpeg": name}, "detail": {...}}, filled in
+    # by auctions.images once the uploaded image has been processed.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Which of PRICE_BUCKETS the current price falls in, so that price
+    # filters can use indexes that also keep the feed order.
+    price_bucket = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated feed of open listings.
+            # Partial, because Django filters booleans as "NOT closed",
+            # which SQLite cannot match against an indexed closed column.
+            models.Index(fields=["-created", "-id"],
+                         condition=models.Q(closed=False),
+                         name="listing_open_feed_idx"),
+            # Serves the same feed within a category, and open counts.
+            models.Index(fields=["category", "-created", "-id"],
+                         condition=models.Q(closed=False),
+                         name="listing_category_open_idx"),
+            # Serves the feed filtered by currency, and currency counts.
+            models.Index(fields=["currency", "-created", "-id"],
+                         condition=models.Q(closed=False),
+                         name="listing_currency_open_idx"),
+            # Serves the feed filtered by price, one run per bucket in
+            # feed order, so a page never sorts the whole range.
+            models.Index(fields=["price_bucket", "-created", "-id"],
+                         condition=models.Q(closed=False),
+                         name="listing_price_feed_idx"),
+            # Cover the facet counts of open listings filtered by price or
+            # by currency. The trailing columns let the exact price bounds
+            # and the open check be read off the index.
+            models.Index(fields=["price_bucket", "category", "currency",
+                                 "current_price", "closed"],
+                         condition=models.Q(closed=False),
+                         name="listing_price_facet_idx"),
+            models.Index(fields=["currency", "price_bucket", "category",
+                                 "current_price", "closed"],
+                         condition=models.Q(closed=False),
+                         name="listing_currency_facet_idx"),
+            # Covers the grouped facet counts, open or closed, whichever
+            # of the other facets filter them.
+            models.Index(fields=["category", "currency", "price_bucket",
+                                 "current_price", "closed"],
+                         name="listing_facet_idx"),
+            # Serves the feed of closed listings.
+            models.Index(fields=["-created", "-id"],
+                         condition=models.Q(closed=True),
+                         name="listing_closed_feed_idx"),
+            # Finds the next open listings to expire.
+            models.Index(fields=["ends_at"],
+                         condition=models.Q(closed=False),
+                         name="listing_open_ends_idx"),
+        ]
+
+    # Kept in step with the listing's bids by auctions.bidding.
+    BID_FIELDS = {"current_price", "top_bidder", "top_bidder_id", "bid_count",
+                  "price_bucket"}
+
+    # Lower bounds of the price ranges counted in the price facet.
+    PRICE_BUCKETS = [0, 10, 50, 100, 500, 1000]
 
     def __str__(self):
         return (
@@ -32,22 +102,104 @@ class Listing(models.Model):
             f"{self.currency}{self.price} created by {self.created_by}"
         )
 
+    @classmethod
+    def bucket_of(cls, price):
+        """The price bucket holding ``price``; the first also holds less."""
+        return max(bisect_right(cls.PRICE_BUCKETS, price) - 1, 0)
+
+    @property
+    def thumbnail(self):
+        return self.image_variants.get("thumb")
+
+    @property
+    def detail_image(self):
+        return self.image_variants.get("detail")
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or self.pk is None or \
+                kwargs.get("force_insert"):
+            if not self.bid_count:
+                self.current_price = self.price
+            self.price_bucket = self.bucket_of(self.current_price)
+            return super().save(*args, **kwargs)
+
+        # Only the conditional UPDATEs of auctions.bidding may write the
+        # bid columns: a full save of a copy loaded before a bid would
+        # otherwise put back the old price, leader and count.
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            # Like Model.save(), a copy loaded with only() saves only the
+            # fields it loaded.
+            deferred = self.get_deferred_fields()
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and
+                             field.attname not in deferred]
+        if "price" in update_fields and Listing.objects.filter(
+                id=self.id, bid_count=0).update(
+                    current_price=self.price,
+                    price_bucket=self.bucket_of(self.price)):
+            # Until the first bid, the current price is the starting one.
+            self.current_price = self.price
+            self.price_bucket = self.bucket_of(self.price)
+        kwargs["update_fields"] = [
+            name for name in update_fields if name not in self.BID_FIELDS]
+        super().save(*args, **kwargs)
+
 
 class Bid(models.Model):
     item = models.ForeignKey(Listing, on_delete=models.CASCADE)
     bid = models.FloatField()
     bid_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Accepted bids only ever raise the price, so this orders a
+            # listing's bids both by amount and by time: it serves the
+            # winner lookup, bid history pages and price history.
+            models.Index(fields=["item", "bid"], name="bid_item_amount_idx"),
+        ]
 
     def __str__(self):
         return f"{self.item} : {self.bid} ({self.bid_by})"
 
 
+class ProxyBid(models.Model):
+    """The most a bidder is willing to pay; auctions.bidding bids for them."""
+    item = models.ForeignKey(Listing, on_delete=models.CASCADE)
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE)
+    maximum = models.FloatField()
+    # Equal maximums are won by whoever set theirs first.
+    placed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item", "bidder"],
+                                    name="proxybid_item_bidder_uniq"),
+        ]
+        indexes = [
+            # Finds the two highest maximums of a listing.
+            models.Index(fields=["item", "-maximum", "placed"],
+                         name="proxybid_item_maximum_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.item} : up to {self.maximum} ({self.bidder})"
+
+
 class Comment(models.Model):
     item = models.ForeignKey(Listing, on_delete=models.CASCADE)
     content = models.TextField()
-    created = models.DateTimeField(auto_now=True)
+    created = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Serves the newest-first keyset pages of a listing's comments.
+            models.Index(fields=["item", "-created", "-id"],
+                         name="comment_item_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.item} : {self.created} ({self.created_by}) says: ({self.content})"
 
@@ -56,5 +208,55 @@ class Watchlist(models.Model):
     item = models.ForeignKey(Listing, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            # Also the index behind a user's watchlist and watched set.
+            models.UniqueConstraint(fields=["user", "item"],
+                                    name="watchlist_user_item_uniq"),
+        ]
+
     def __str__(self):
         return f"{self.user} : {self.item}"
+
+
+class AuctionResult(models.Model):
+    """Outcome of a closed auction, recorded once per listing."""
+    listing = models.OneToOneField(
+        Listing, on_delete=models.CASCADE, related_name="result")
+    winner = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True)
+    winning_bid = models.ForeignKey(
+        Bid, on_delete=models.SET_NULL, null=True, blank=True)
+    price = models.FloatField(null=True, blank=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        if self.winner_id is None:
+            return f"{self.listing} : no bids"
+        return f"{self.listing} : won by {self.winner} for {self.price}"
+
+
+class ListingImport(models.Model):
+    """Progress of a bulk listing import, committed together with each batch.
+
+    Imports are identified by the checksum of the file and the seller, so
+    running the same file again for the same seller resumes after the last
+    committed line instead of inserting duplicates.
+    """
+    checksum = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    lines_done = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["checksum", "seller"],
+                                    name="listingimport_checksum_seller_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.imported} imported, {self.rejected} rejected)"
@@ -0,0 +1,57 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(model, fields, cursor):
+    """Turn a cursor back into one Python value per keyset field."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        return [
+            model._meta.get_field(f).to_python(v)
+            for f, v in zip(fields, values)
+        ]
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_page(queryset, cursor=None, per_page=25, fields=("created", "id")):
+    """Return (items, next_cursor) for a newest-first keyset page.
+
+    Rows are ordered descending on ``fields`` and a page starts strictly
+    after the row the cursor was taken from, so fetching page N costs the
+    same index range scan as page one. ``next_cursor`` is None on the last
+    page.
+    """
+    queryset = queryset.order_by(*[f"-{f}" for f in fields])
+    if cursor:
+        values = decode_cursor(queryset.model, fields, cursor)
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        after = Q(**{f"{fields[-1]}__lt": values[-1]})
+        for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+            after = Q(**{f"{field}__lt": value}) | (Q(**{field: value}) & after)
+        queryset = queryset.filter(after)
+
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(
+            [getattr(last, queryset.model._meta.get_field(f).attname)
+             for f in fields])
+    return items, next_cursor
@@ -0,0 +1,108 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+
+from .models import Listing
+
+FTS_TABLE = "auctions_listing_fts"
+
+# item matches weigh ten times more than description matches
+BM25_WEIGHTS = (10.0, 1.0)
+
+
+# Keep the external-content index in step with auctions_listing, including
+# for bulk_create() and update() writes that bypass model signals.
+TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT"
+    f" ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}(rowid, item, description)"
+    f" VALUES (new.id, new.item, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE"
+    f" ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, item, description)"
+    f" VALUES ('delete', old.id, old.item, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF item,"
+    f" description ON auctions_listing BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, item, description)"
+    f" VALUES ('delete', old.id, old.item, old.description);"
+    f" INSERT INTO {FTS_TABLE}(rowid, item, description)"
+    f" VALUES (new.id, new.item, new.description); END",
+]
+
+
+def fts_available():
+    return connection.vendor == "sqlite"
+
+
+def ensure_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Recreate the sync triggers if a migration dropped them.
+
+    SQLite migrations that alter auctions_listing rebuild the table, which
+    silently drops its triggers; this runs after every migrate.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite" or \
+            FTS_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for sql in TRIGGERS:
+            cursor.execute(sql)
+
+
+def match_expression(text):
+    """Turn free text into a safe FTS5 query of prefix-matched terms.
+
+    Every word is quoted so user input can never be parsed as FTS5 syntax;
+    terms are implicitly ANDed. Returns "" when there is nothing to search.
+    """
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", text))
+
+
+def search_listings(text, page=1, per_page=25):
+    """Return (listings, has_next) for open listings matching ``text``.
+
+    Results are ranked by BM25 inside SQLite, so only the ids of one page
+    ever leave the database.
+    """
+    expression = match_expression(text)
+    if not expression:
+        return [], False
+    offset = (page - 1) * per_page
+
+    if not fts_available():
+        listings = list(
+            Listing.objects.filter(
+                Q(item__icontains=text) | Q(description__icontains=text),
+                closed=False,
+            ).order_by("-created", "-id")[offset:offset + per_page + 1])
+        return listings[:per_page], len(listings) > per_page
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT f.rowid FROM {FTS_TABLE} f"
+            f" JOIN auctions_listing l ON l.id = f.rowid"
+            f" WHERE {FTS_TABLE} MATCH %s AND NOT l.closed"
+            f" ORDER BY bm25({FTS_TABLE}, %s, %s)"
+            f" LIMIT %s OFFSET %s",
+            [expression, *BM25_WEIGHTS, per_page + 1, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    listings = Listing.objects.in_bulk(ids[:per_page])
+    return [listings[i] for i in ids[:per_page] if i in listings], \
+        len(ids) > per_page
+
+
+def rebuild_index():
+    """Rebuild the FTS index from auctions_listing and return its size.
+
+    FTS5 rereads an external-content table itself with the 'rebuild'
+    command. Deleting the index and reinserting rows would fight the sync
+    triggers over rows written in between and leave stale entries behind;
+    one transaction means searches see the old index until it is done.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute("SELECT count(*) FROM auctions_listing")
+        return cursor.fetchone()[0]
@@ -0,0 +1,94 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .caching import listings_changed
+from .models import Bid, Category, Comment, Listing, User, Watchlist
+
+CURRENCIES = ["USD", "EUR", "GBP", "VND"]
+
+
+def _inserted(model, objs, batch_size):
+    """bulk_create ``objs`` and return them with primary keys filled in.
+
+    SQLite cannot return ids from a bulk insert, so the new rows are read
+    back as the highest ids of the table; seeding is not meant to run
+    alongside other writers.
+    """
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    ids = sorted(model.objects.order_by("-id").values_list(
+        "id", flat=True)[:len(objs)])
+    for obj, id in zip(objs, ids):
+        obj.id = id
+    return objs
+
+
+@transaction.atomic
+def seed_dataset(users=10, categories=5, listings=100, bids_per_listing=2,
+                 comments_per_listing=2, watchlist_per_user=5,
+                 batch_size=1000, password="password", seed=0):
+    """Insert a synthetic, internally consistent auction dataset.
+
+    Every table is written with bulk_create in ``batch_size`` chunks and the
+    denormalized price columns on Listing agree with the generated bids.
+    All users share ``password``. Returns the number of rows per model.
+    """
+    rng = random.Random(seed)
+    start = User.objects.count()
+    hashed = make_password(password)
+
+    new_users = _inserted(User, [
+        User(username=f"user{start + i}", email=f"user{start + i}@example.com",
+             first_name=f"First{start + i}", last_name=f"Last{start + i}",
+             password=hashed)
+        for i in range(users)
+    ], batch_size)
+    new_categories = _inserted(Category, [
+        Category(name=f"Category {i}") for i in range(categories)
+    ], batch_size)
+
+    plans = []
+    for i in range(listings):
+        seller = rng.choice(new_users)
+        price = round(rng.uniform(1, 1000), 2)
+        bids = [(price + 5 * (n + 1), rng.choice(new_users))
+                for n in range(bids_per_listing)]
+        current_price = bids[-1][0] if bids else price
+        listing = Listing(
+            item=f"Item {i}", description=f"Synthetic listing number {i}",
+            price=price, currency=rng.choice(CURRENCIES),
+            category=rng.choice(new_categories), created_by=seller,
+            current_price=current_price,
+            price_bucket=Listing.bucket_of(current_price),
+            top_bidder=bids[-1][1] if bids else None,
+            bid_count=len(bids))
+        plans.append((listing, bids))
+    new_listings = _inserted(Listing, [p[0] for p in plans], batch_size)
+
+    Bid.objects.bulk_create([
+        Bid(item=listing, bid=amount, bid_by=bidder)
+        for listing, bids in plans for amount, bidder in bids
+    ], batch_size=batch_size)
+    Comment.objects.bulk_create([
+        Comment(item=listing, content=f"Comment {n} on {listing.item}",
+                created_by=rng.choice(new_users))
+        for listing in new_listings for n in range(comments_per_listing)
+    ], batch_size=batch_size)
+    Watchlist.objects.bulk_create([
+        Watchlist(item=listing, user=user)
+        for user in new_users
+        for listing in rng.sample(
+            new_listings, min(watchlist_per_user, len(new_listings)))
+    ], batch_size=batch_size)
+    listings_changed(*(listing.id for listing in new_listings),
+                     catalog=True)
+
+    return {
+        "users": users,
+        "categories": categories,
+        "listings": listings,
+        "bids": listings * bids_per_listing,
+        "comments": listings * comments_per_listing,
+        "watchlists": users * min(watchlist_per_user, listings),
+    }
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import re
+
+from .async_views import read
+from .events import get_backend
+from .models import Listing
+
+EVENTS_PATH = re.compile(r"/listing/(?P<id>\d+)/events")
+
+# Comment lines sent while idle keep proxies from closing the stream.
+HEARTBEAT_SECONDS = 15
+
+
+def format_event(event):
+    return f"event: listing\ndata: {json.dumps(event)}\n\n".encode()
+
+
+async def listing_events(scope, receive, send, listing_id):
+    """ASGI app streaming a listing's price, bid count and closed state.
+
+    The current state is sent first, then every event published for the
+    listing, until the client disconnects. Waiting costs no thread: events
+    are handed to this task's queue from whichever thread published them.
+    """
+    # Subscribe before reading the current state, so that an event
+    # published in between is queued rather than lost. At worst the
+    # client then sees a change it already has.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    unsubscribe = get_backend().subscribe(
+        listing_id, lambda event: loop.call_soon_threadsafe(
+            queue.put_nowait, event))
+
+    try:
+        listing = await read(lambda: Listing.objects.only(
+            "current_price", "bid_count", "closed").filter(
+                id=listing_id).first())
+    except BaseException:
+        unsubscribe()
+        raise
+    if listing is None:
+        unsubscribe()
+        await send({"type": "http.response.start", "status": 404,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"No such listing!"})
+        return
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        await send({"type": "http.response.body", "more_body": True,
+                    "body": format_event({
+                        "price": listing.current_price,
+                        "bid_count": listing.bid_count,
+                        "closed": listing.closed,
+                    })})
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected}, timeout=HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                body = format_event(next_event.result())
+            else:
+                next_event.cancel()
+                if disconnected.done():
+                    break
+                body = b": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": body,
+                        "more_body": True})
+    finally:
+        unsubscribe()
+        disconnected.cancel()
+
+
+def with_listing_events(application):
+    """Wrap the Django ASGI application to serve listing event streams."""
+    async def dispatch(scope, receive, send):
+        if scope["type"] == "http":
+            match = EVENTS_PATH.fullmatch(scope["path"])
+            if match:
+                return await listing_events(
+                    scope, receive, send, int(match["id"]))
+        return await application(scope, receive, send)
+    return dispatch
@@ -0,0 +1,13 @@
+from django import template
+
+from .. import image_proxy
+
+register = template.Library()
+
+
+@register.filter
+def proxied(url, variant="thumb"):
+    """Route a remote http(s) image URL through the local image proxy."""
+    if not url or not image_proxy.is_proxyable(url):
+        return url
+    return image_proxy.proxy_url(url, variant or "thumb")
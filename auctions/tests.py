@@ -1,3 +1,1852 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    async_views, caching, checks, events, expiry, facets, image_proxy, images,
+    search, sse, views,
+)
+from .bidding import place_bid, place_proxy_bid, resolve
+from .expiry import close_expired, close_expired_batch
+from .management.commands import benchmark
+from .management.commands.benchmark import summarize
+from .database import retry_on_lock
+from .imports import import_listings
+from .middleware import rolling_stats
+from .models import (
+    AuctionResult, Bid, Category, Comment, Listing, ListingImport, ProxyBid,
+    User, Watchlist,
+)
+from .pagination import keyset_page
+from .search import rebuild_index, search_listings
+from .sse import with_listing_events
+from .seeding import seed_dataset
+
+
+class PlaceBidTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidder = User.objects.create_user("bidder", "b@example.com", "pw")
+        self.listing = Listing.objects.create(
+            item="Lamp", price=10, currency="USD",
+            category=Category.objects.create(name="Home"),
+            created_by=self.seller)
+
+    def test_accepts_higher_bid(self):
+        bid = place_bid(self.listing.id, self.bidder, 12)
+        self.assertIsNotNone(bid)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, 12)
+        self.assertEqual(self.listing.top_bidder, self.bidder)
+        self.assertEqual(self.listing.bid_count, 1)
+
+    def test_rejects_bid_not_above_current_price(self):
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, 10))
+        place_bid(self.listing.id, self.bidder, 15)
+        self.assertIsNone(place_bid(self.listing.id, self.seller, 15))
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_rejects_bid_on_closed_listing(self):
+        Listing.objects.filter(id=self.listing.id).update(closed=True)
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, 100))
+        self.assertFalse(Bid.objects.exists())
+
+    def test_saving_a_stale_copy_keeps_bids(self):
+        stale = Listing.objects.get(id=self.listing.id)
+        place_bid(self.listing.id, self.bidder, 12)
+        stale.description = "Brass"
+        stale.save()
+        stale.price = 5
+        stale.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.description, "Brass")
+        self.assertEqual(self.listing.price, 5)
+        self.assertEqual(self.listing.current_price, 12)
+        self.assertEqual(self.listing.top_bidder, self.bidder)
+        self.assertEqual(self.listing.bid_count, 1)
+
+    def test_saving_a_partial_copy_writes_only_its_fields(self):
+        partial = Listing.objects.only("item").get(id=self.listing.id)
+        Listing.objects.filter(id=self.listing.id).update(description="New")
+        partial.item = "Desk lamp"
+        with self.assertNumQueries(1):
+            partial.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.item, "Desk lamp")
+        self.assertEqual(self.listing.description, "New")
+
+    def test_starting_price_edits_apply_until_the_first_bid(self):
+        self.listing.price = 20
+        self.listing.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, 20)
+        self.assertIsNone(place_bid(self.listing.id, self.bidder, 15))
+
+    def test_price_buckets_follow_the_current_price(self):
+        self.assertEqual(self.listing.price_bucket, 1)
+        self.listing.price = 5
+        self.listing.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.price_bucket, 0)
+        place_bid(self.listing.id, self.bidder, 8)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.price_bucket, 0)
+        place_bid(self.listing.id, self.bidder, 60)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.price_bucket, 2)
+
+
+@override_settings(BID_INCREMENTS=[(0, 1), (100, 5)])
+class ProxyBidTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.alice = User.objects.create_user("alice", "a@example.com", "pw")
+        self.bob = User.objects.create_user("bob", "b@example.com", "pw")
+        self.listing = Listing.objects.create(
+            item="Lamp", price=10, currency="USD",
+            category=Category.objects.create(name="Home"),
+            created_by=self.seller)
+
+    def bids(self):
+        return list(Bid.objects.filter(item=self.listing).order_by(
+            "id").values_list("bid_by__username", "bid"))
+
+    def assertPrice(self, price, leader, bid_count):
+        self.listing.refresh_from_db()
+        self.assertEqual(
+            (self.listing.current_price, self.listing.top_bidder,
+             self.listing.bid_count), (price, leader, bid_count))
+        self.assertEqual(self.listing.price_bucket, Listing.bucket_of(price))
+
+    def test_resolve(self):
+        self.assertEqual(resolve(10, None, []), [])
+        self.assertEqual(resolve(10, None, [(1, 50)]), [(1, 11)])
+        self.assertEqual(resolve(10, 1, [(1, 50)]), [])
+        self.assertEqual(resolve(10, None, [(1, 10.5)]), [(1, 10.5)])
+        self.assertEqual(resolve(20, 2, [(1, 150), (2, 99.5)]),
+                         [(2, 99.5), (1, 100.5)])
+        self.assertEqual(resolve(20, 2, [(1, 150), (2, 120)]),
+                         [(2, 120), (1, 125)])
+        self.assertEqual(resolve(20, 2, [(1, 50), (2, 50)]), [(1, 50)])
+
+    def test_first_proxy_bids_one_increment(self):
+        self.assertEqual(len(place_proxy_bid(
+            self.listing.id, self.alice, 50)), 1)
+        self.assertPrice(11, self.alice, 1)
+
+    def test_bidding_war_is_resolved_in_one_call(self):
+        place_proxy_bid(self.listing.id, self.alice, 50)
+        with self.assertNumQueries(8):
+            # Read the listing, store the maximum (update, then insert),
+            # find the two highest maximums, insert the bids, update the
+            # price, inside a savepoint.
+            place_proxy_bid(self.listing.id, self.bob, 120)
+        self.assertEqual(self.bids(), [
+            ("alice", 11), ("alice", 50), ("bob", 51)])
+        self.assertPrice(51, self.bob, 3)
+
+    def test_losing_proxy_bids_its_maximum(self):
+        place_proxy_bid(self.listing.id, self.alice, 50)
+        place_proxy_bid(self.listing.id, self.bob, 30)
+        self.assertEqual(self.bids(), [
+            ("alice", 11), ("bob", 30), ("alice", 31)])
+        self.assertPrice(31, self.alice, 3)
+
+    def test_equal_maximums_go_to_the_earlier_proxy(self):
+        place_proxy_bid(self.listing.id, self.alice, 50)
+        place_proxy_bid(self.listing.id, self.bob, 50)
+        self.assertPrice(50, self.alice, 2)
+
+    def test_proxy_answers_single_bids(self):
+        place_proxy_bid(self.listing.id, self.alice, 50)
+        bid = place_bid(self.listing.id, self.bob, 20)
+        self.assertEqual(bid.bid, 20)
+        self.assertPrice(21, self.alice, 3)
+        place_bid(self.listing.id, self.bob, 60)
+        self.assertPrice(60, self.bob, 4)
+
+    def test_leader_raising_their_maximum_places_no_bid(self):
+        place_proxy_bid(self.listing.id, self.alice, 50)
+        self.assertEqual(place_proxy_bid(self.listing.id, self.alice, 80), [])
+        self.assertEqual(ProxyBid.objects.get().maximum, 80)
+        place_proxy_bid(self.listing.id, self.bob, 60)
+        self.assertPrice(61, self.alice, 3)
+
+    def test_rejects_maximum_not_above_price_and_closed_listings(self):
+        self.assertIsNone(place_proxy_bid(self.listing.id, self.alice, 10))
+        Listing.objects.filter(id=self.listing.id).update(closed=True)
+        self.assertIsNone(place_proxy_bid(self.listing.id, self.alice, 50))
+        self.assertFalse(ProxyBid.objects.exists())
+
+    def test_view(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse("proxy_bid"), {
+            "item": self.listing.id, "maximum": 40})
+        self.assertRedirects(
+            response, reverse("listing", args=[self.listing.id]),
+            fetch_redirect_response=False)
+        self.assertPrice(11, self.alice, 1)
+        version = caching.listing_version(self.listing.id)
+        place_proxy_bid(self.listing.id, self.bob, 30)
+        self.assertNotEqual(caching.listing_version(self.listing.id), version)
+        response = self.client.post(reverse("proxy_bid"), {
+            "item": self.listing.id, "maximum": 5})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentBidStressTest(TransactionTestCase):
+    THREADS = 16
+    BIDS_PER_THREAD = 150
+
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidders = [
+            User.objects.create_user(f"bidder{i}", f"b{i}@example.com", "pw")
+            for i in range(self.THREADS)
+        ]
+        self.listing = Listing.objects.create(
+            item="Painting", price=1, currency="USD",
+            category=Category.objects.create(name="Art"),
+            created_by=seller)
+
+    def test_concurrent_bids_are_monotonic_and_never_lost(self):
+        accepted = []
+        submitted = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.THREADS)
+
+        def worker(user):
+            rng = random.Random(user.id)
+            amounts = [rng.uniform(1, 10000) for _ in range(self.BIDS_PER_THREAD)]
+            start.wait()
+            try:
+                for amount in amounts:
+                    bid = place_bid(self.listing.id, user, amount)
+                    with lock:
+                        submitted.append(amount)
+                        if bid is not None:
+                            accepted.append(bid.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(u,)) for u in self.bidders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(submitted), self.THREADS * self.BIDS_PER_THREAD)
+
+        bids = list(Bid.objects.filter(item=self.listing).order_by("id"))
+        self.assertEqual(sorted(accepted), [b.id for b in bids])
+        for previous, current in zip(bids, bids[1:]):
+            self.assertGreater(current.bid, previous.bid)
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, len(bids))
+        self.assertEqual(self.listing.current_price, max(submitted))
+        self.assertEqual(self.listing.current_price, bids[-1].bid)
+        self.assertEqual(self.listing.top_bidder_id, bids[-1].bid_by_id)
+
+
+class ListingFeedTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        category = Category.objects.create(name="Misc")
+        for i in range(12):
+            Listing.objects.create(
+                item=f"Item {i}", price=i + 1, currency="USD",
+                category=category, created_by=seller, closed=i % 4 == 0)
+
+    def test_keyset_pages_cover_open_listings_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = keyset_page(
+                Listing.objects.filter(closed=False), cursor, per_page=4)
+            seen += [l.id for l in page]
+            if cursor is None:
+                break
+        expected = Listing.objects.filter(closed=False).order_by(
+            "-created", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_edits_do_not_move_listings(self):
+        first = keyset_page(
+            Listing.objects.filter(closed=False), per_page=4)[0]
+        oldest = Listing.objects.filter(closed=False).earliest("created")
+        created = oldest.created
+        oldest.description = "Edited"
+        oldest.save()
+        self.assertEqual(oldest.created, created)
+        self.assertEqual(keyset_page(
+            Listing.objects.filter(closed=False), per_page=4)[0], first)
+        self.assertNotIn(oldest, first)
+
+    def test_index_rejects_malformed_cursor(self):
+        response = self.client.get(reverse("index"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_hides_closed_listings(self):
+        response = self.client.get(reverse("index"))
+        self.assertNotContains(response, "Item 0<")
+        self.assertContains(response, "Item 1<")
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        category = Category.objects.create(name="Music")
+        self.guitar = Listing.objects.create(
+            item="Acoustic guitar", description="Spruce top", price=100,
+            currency="USD", category=category, created_by=seller)
+        self.case = Listing.objects.create(
+            item="Hard case", description="Fits any acoustic guitar",
+            price=40, currency="USD", category=category, created_by=seller)
+
+    def test_ranks_title_matches_first(self):
+        results, has_next = search_listings("guitar")
+        self.assertEqual(results, [self.guitar, self.case])
+        self.assertFalse(has_next)
+
+    def test_index_follows_edits_and_closing(self):
+        Listing.objects.filter(id=self.case.id).update(item="Drum stool")
+        self.assertEqual(search_listings("stool")[0], [self.case])
+        Listing.objects.filter(id=self.case.id).update(closed=True)
+        self.assertEqual(search_listings("stool")[0], [])
+
+    def test_prefix_match_and_syntax_characters(self):
+        self.assertEqual(search_listings('acou"(')[0], [self.guitar, self.case])
+        self.assertEqual(search_listings("***")[0], [])
+
+    def test_rebuild_repairs_a_stale_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {search.FTS_TABLE}_au")
+        Listing.objects.filter(id=self.case.id).update(item="Drum stool")
+        search.ensure_triggers()
+        self.assertEqual(search_listings("stool")[0], [])
+
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(search_listings("stool")[0], [self.case])
+        self.assertEqual(search_listings("hard")[0], [])
+        self.assertEqual(search_listings("spruce")[0], [self.guitar])
+
+    def test_search_pages(self):
+        response = self.client.get(reverse("search"), {"q": "guitar"})
+        self.assertEqual(list(response.context["listings"]),
+                         [self.guitar, self.case])
+        for page in ["x", str(2 ** 63)]:
+            response = self.client.get(
+                reverse("search"), {"q": "guitar", "page": page})
+            self.assertEqual(response.status_code, 400, page)
+
+    def test_fallback_searches_descriptions(self):
+        with mock.patch.object(search, "fts_available", return_value=False):
+            results, has_next = search_listings("guitar")
+        self.assertEqual(results, [self.case, self.guitar])
+        self.assertFalse(has_next)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        rolling_stats.clear()
+        cache.clear()
+        self.staff = User.objects.create_user(
+            "staff", "staff@example.com", "pw", is_staff=True)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("index"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'sql;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r"template;dur=[\d.]+")
+        self.assertRegex(timing, r"total;dur=[\d.]+")
+
+    @override_settings(PERFORMANCE_SLOW_REQUEST_MS=-1)
+    def test_slow_requests_are_logged_with_slowest_query(self):
+        with self.assertLogs("auctions.performance", "WARNING") as logs:
+            self.client.get(reverse("index"))
+        self.assertIn("slowest query", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_stats_are_staff_only(self):
+        response = self.client.get(reverse("performance_stats"))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.force_login(self.staff)
+        stats = self.client.get(reverse("performance_stats")).json()
+        self.assertEqual(stats["index"]["count"], 2)
+        self.assertEqual(
+            set(stats["index"]["total_ms"]), {"p50", "p95", "p99"})
+
+
+class QueryBudgetMixin:
+    """Every named route must stay within a fixed number of queries.
+
+    Subclasses seed the same shape of data at different scales, with more
+    bids, comments and watched items per listing as the scale grows, so
+    a query count that depends on data size fails at the larger scales.
+    """
+
+    SCALE = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(**cls.SCALE)
+        cls.listing = Listing.objects.filter(bid_count__gt=0).latest("id")
+        cls.seller = cls.listing.created_by
+        cls.user = User.objects.exclude(id=cls.seller.id).first()
+
+    def assertMaxQueries(self, budget, method, name, args=None, data=None,
+                         user=None, **extra):
+        if user is not None:
+            self.client.force_login(user)
+        url = reverse(name, args=args)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, **extra)
+            if response.streaming:
+                # Streamed bodies query as they are read.
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f"{method} {url}")
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{method.upper()} {url} ran {len(queries)} queries:\n" +
+            "\n".join(q["sql"] for q in queries))
+
+    def test_index(self):
+        # The feed and the facet counts, see FacetTests.
+        self.assertMaxQueries(5, "get", "index")
+        # The third query loads the watched set into the cache.
+        self.assertMaxQueries(4, "get", "index", user=self.user)
+        self.assertMaxQueries(3, "get", "index", user=self.user)
+
+    def test_listing_page(self):
+        self.assertMaxQueries(3, "get", "listing", [self.listing.id])
+        self.assertMaxQueries(
+            6, "get", "listing", [self.listing.id], user=self.user)
+
+    def test_listing_events(self):
+        # Under WSGI the stream is not served; ASGI intercepts the path.
+        self.assertMaxQueries(0, "get", "listing_events", [self.listing.id])
+
+    def test_create_listing(self):
+        self.assertMaxQueries(3, "get", "create_listing", user=self.user)
+        self.assertMaxQueries(5, "post", "listing", data={
+            "item": "New", "description": "", "price": 5, "currency": "USD",
+            "image_url": "", "category": self.listing.category_id,
+        }, user=self.user)
+
+    def test_comments_fragment(self):
+        self.assertMaxQueries(1, "get", "comments", [self.listing.id])
+
+    def test_bid_history(self):
+        self.assertMaxQueries(1, "get", "bids", [self.listing.id])
+        self.assertMaxQueries(2, "get", "price_history", [self.listing.id])
+
+    def test_close_listing(self):
+        # Includes finding the winner and recording the result, in a
+        # savepoint here since the test itself runs in a transaction.
+        self.assertMaxQueries(
+            9, "post", "close_listing", [self.listing.id], user=self.seller)
+
+    def test_bid(self):
+        # Includes looking for proxy bids that answer it.
+        self.assertMaxQueries(10, "post", "bid", data={
+            "item": self.listing.id, "bid": self.listing.current_price + 1,
+        }, user=self.user)
+
+    def test_proxy_bid(self):
+        # Includes storing the maximum and the bid it places at once.
+        self.assertMaxQueries(12, "post", "proxy_bid", data={
+            "item": self.listing.id, "maximum": self.listing.current_price + 5,
+        }, user=self.user)
+
+    def test_comment(self):
+        self.assertMaxQueries(5, "post", "comment", data={
+            "item": self.listing.id, "content": "Nice",
+        }, user=self.user)
+
+    def test_watchlist(self):
+        self.assertMaxQueries(3, "get", "watchlist", user=self.user)
+        self.assertMaxQueries(5, "post", "watchlist", data={
+            "item": self.listing.id,
+        }, user=self.user)
+        # Deleting loads the rows first, for the cache-invalidating signal.
+        self.assertMaxQueries(6, "post", "watchlist", data={
+            "item": self.listing.id, "delete": True,
+        }, user=self.user)
+
+    def test_async_pages(self):
+        # Reads normally run on worker threads, each with its own
+        # connection; keep them on the test's connection to count them.
+        async def read(fn, *args):
+            return await sync_to_async(fn)(*args)
+
+        with mock.patch.object(async_views, "read", read):
+            self.assertMaxQueries(8, "get", "async_index", user=self.user)
+            self.assertMaxQueries(
+                4, "get", "async_listing", [self.listing.id], user=self.user)
+            self.assertMaxQueries(3, "get", "async_category", user=self.user)
+            self.assertMaxQueries(4, "get", "async_category",
+                                  [self.listing.category_id], user=self.user)
+            self.assertMaxQueries(3, "get", "async_watchlist", user=self.user)
+
+    def test_api(self):
+        # From a cold cache: unknown versions are checked against the
+        # listing table once, then cached.
+        cache.clear()
+        self.assertMaxQueries(1, "get", "api_listings")
+        self.assertMaxQueries(2, "get", "api_listing", [self.listing.id])
+        self.assertMaxQueries(2, "get", "api_bids", [self.listing.id])
+        self.assertMaxQueries(2, "get", "api_comments", [self.listing.id])
+        self.assertMaxQueries(1, "get", "api_categories")
+        self.assertMaxQueries(4, "get", "api_watchlist", user=self.user)
+
+    def test_watchlist_bulk(self):
+        watched = list(Watchlist.objects.filter(
+            user=self.user).values_list("item_id", flat=True))
+        unwatched = list(Listing.objects.exclude(
+            id__in=watched).values_list("id", flat=True)[:20])
+        # One query per step whatever the number of ids, with removals
+        # loading the rows first like single deletes.
+        self.assertMaxQueries(10, "post", "watchlist_bulk", data={
+            "add": unwatched, "remove": watched,
+        }, user=self.user, content_type="application/json")
+
+    def test_categories(self):
+        self.assertMaxQueries(3, "get", "category", user=self.user)
+        self.assertMaxQueries(
+            4, "get", "category", [self.listing.category_id], user=self.user)
+
+    def test_search(self):
+        self.assertMaxQueries(4, "get", "search", data={"q": "item"},
+                              user=self.user)
+
+    def test_performance_stats(self):
+        self.seller.is_staff = True
+        self.seller.save()
+        self.assertMaxQueries(2, "get", "performance_stats", user=self.seller)
+
+    def test_export(self):
+        self.seller.is_staff = True
+        self.seller.save()
+        # Rows and the names they refer to come from one streamed query.
+        for kind in ["listings", "bids", "comments"]:
+            self.assertMaxQueries(3, "get", "export", [kind],
+                                  user=self.seller)
+
+    def test_image_variant(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with override_settings(MEDIA_ROOT=media.name):
+            default_storage.save(f"{images.VARIANT_DIR}/0a1b-thumb.jpeg",
+                                 ContentFile(b"jpeg"))
+            # Served from storage without touching the database.
+            self.assertMaxQueries(
+                0, "get", "image_variant", ["0a1b-thumb.jpeg"])
+
+    def test_image_proxy(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        url = image_proxy.proxy_url("https://images.example.com/a.png",
+                                    "thumb")
+        with override_settings(IMAGE_PROXY_FETCHER="auctions.tests.stub_fetch",
+                               IMAGE_PROXY_CACHE_DIR=cache_dir.name):
+            # Fetching and resizing never touch the database.
+            self.assertMaxQueries(0, "get", "image_proxy", ["thumb"],
+                                  data=dict(parse_qsl(urlsplit(url).query)))
+
+    def test_authentication(self):
+        self.assertMaxQueries(0, "get", "login")
+        self.assertMaxQueries(0, "get", "register")
+        self.assertMaxQueries(9, "post", "login", data={
+            "username": self.user.username, "password": "password",
+        })
+        self.assertMaxQueries(4, "get", "logout")
+        self.assertMaxQueries(10, "post", "register", data={
+            "username": "newcomer", "email": "new@example.com",
+            "password": "pw", "confirmation": "pw",
+        })
+
+
+class SmallQueryBudgetTests(QueryBudgetMixin, TestCase):
+    SCALE = dict(users=5, categories=2, listings=10, bids_per_listing=1,
+                 comments_per_listing=1, watchlist_per_user=1)
+
+
+class MediumQueryBudgetTests(QueryBudgetMixin, TestCase):
+    SCALE = dict(users=50, categories=10, listings=1000, bids_per_listing=3,
+                 comments_per_listing=5, watchlist_per_user=20)
+
+
+class LargeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    SCALE = dict(users=200, categories=20, listings=10000,
+                 bids_per_listing=5, comments_per_listing=10,
+                 watchlist_per_user=100)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        seed_dataset(users=3, categories=2, listings=6, bids_per_listing=2,
+                     comments_per_listing=1, watchlist_per_user=0)
+        self.client.force_login(User.objects.create_user(
+            "staff", "staff@example.com", "pw", is_staff=True))
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse("export", args=[kind]), params)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson_listings(self):
+        response, body = self.export("listings")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["created_by"], Listing.objects.order_by(
+            "id").first().created_by.username)
+
+    def test_csv_bids_filtered_by_category(self):
+        category = Category.objects.first()
+        _, body = self.export("bids", format="csv", category=category.id)
+        lines = body.splitlines()
+        self.assertEqual(
+            lines[0], "id,listing_id,listing,currency,bid,bid_by,created")
+        self.assertEqual(
+            len(lines) - 1, Bid.objects.filter(item__category=category).count())
+
+    def test_closed_and_time_filters(self):
+        Listing.objects.filter(id=Listing.objects.first().id).update(closed=True)
+        _, body = self.export("comments", closed="true")
+        self.assertEqual(len(body.splitlines()), 1)
+        _, body = self.export("listings", since="2999-01-01")
+        self.assertEqual(body, "")
+        _, body = self.export("bids", until="2999-01-01T00:00:00Z")
+        self.assertEqual(len(body.splitlines()), Bid.objects.count())
+
+    def test_invalid_requests(self):
+        for kind, params in [("users", {}), ("bids", {"since": "yesterday"}),
+                             ("listings", {"since": "2020-02-30"}),
+                             ("comments", {"until": "2020-01-01T25:00"}),
+                             ("listings", {"category": "0"}),
+                             ("bids", {"category": str(2 ** 63)}),
+                             ("bids", {"format": "xml"})]:
+            response = self.client.get(reverse("export", args=[kind]), params)
+            self.assertEqual(response.status_code, 400)
+
+
+class ListingImportTests(TestCase):
+    CSV = (
+        "item,description,price,currency,image_url,category\n"
+        "Chair,Oak,20,USD,,Furniture\n"
+        "Table,,not-a-price,USD,,Furniture\n"
+        "Poster,Signed,15,USD,,Art\n"
+        "Rug,,5,TOOLONG,,Home\n"
+        "Lamp,,8,USD,,Home\n"
+    ).encode()
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        Category.objects.create(name="Art")
+
+    def run_import(self, data=CSV, format="csv", batch_size=2):
+        return import_listings(
+            io.BytesIO(data), "catalog.csv", self.seller, format, batch_size)
+
+    def test_imports_valid_rows_and_reports_rejects(self):
+        state, rejects = self.run_import()
+        self.assertEqual([line for line, _ in rejects], [3, 5])
+        self.assertIn("price", rejects[0][1])
+        self.assertEqual((state.imported, state.rejected), (3, 2))
+        self.assertEqual(
+            sorted(Category.objects.values_list("name", flat=True)),
+            ["Art", "Furniture", "Home"])
+        lamp = Listing.objects.get(item="Lamp")
+        self.assertEqual((lamp.current_price, lamp.created_by), (8, self.seller))
+        self.assertEqual(Listing.objects.get(item="Chair").price_bucket, 1)
+
+    def test_jsonl(self):
+        data = b'{"item": "Vase", "price": 3, "currency": "EUR", "category": "Art"}\n[]\n'
+        state, rejects = self.run_import(data, "jsonl")
+        self.assertEqual(state.imported, 1)
+        self.assertEqual([line for line, _ in rejects], [2])
+
+    def test_resumes_after_crash(self):
+        original = Listing.objects.bulk_create
+        calls = []
+
+        def crash_on_second_batch(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError("crash")
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(Listing.objects, "bulk_create",
+                               crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import()
+        self.assertEqual(ListingImport.objects.get().lines_done, 3)
+        self.assertEqual(Listing.objects.count(), 1)
+
+        state, rejects = self.run_import()
+        self.assertTrue(state.finished)
+        self.assertEqual([line for line, _ in rejects], [5])
+        self.assertEqual(Listing.objects.count(), 3)
+
+        self.run_import()
+        self.assertEqual(Listing.objects.count(), 3)
+
+    def test_same_file_for_another_seller_is_a_new_import(self):
+        self.run_import()
+        other = User.objects.create_user("other", "o@example.com", "pw")
+        state, _ = import_listings(
+            io.BytesIO(self.CSV), "catalog.csv", other, "csv", 2)
+        self.assertEqual(state.seller, other)
+        self.assertEqual(state.imported, 3)
+        self.assertEqual(Listing.objects.filter(created_by=other).count(), 3)
+        self.assertEqual(Listing.objects.filter(
+            created_by=self.seller).count(), 3)
+
+    def test_admin_upload(self):
+        self.client.force_login(User.objects.create_superuser(
+            "admin", "a@example.com", "pw"))
+        response = self.client.post(
+            reverse("admin:auctions_listingimport_upload"), {
+                "file": SimpleUploadedFile("catalog.csv", self.CSV),
+                "format": "csv",
+                "seller": self.seller.id,
+                "batch_size": 100,
+            }, follow=True)
+        self.assertContains(response, "Line 3: price")
+        self.assertEqual(Listing.objects.count(), 3)
+
+
+class CommentPaginationTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.listing = Listing.objects.create(
+            item="Clock", price=5, currency="USD",
+            category=Category.objects.create(name="Home"), created_by=seller)
+        for i in range(45):
+            Comment.objects.create(
+                item=self.listing, content=f"comment-{i}-", created_by=seller)
+
+    def test_listing_shows_newest_page_then_fragments_load_the_rest(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id]))
+        self.assertContains(response, "comment-44-")
+        self.assertNotContains(response, "comment-24-")
+        cursor = response.context["next_comments"]
+
+        seen = []
+        while cursor:
+            page = self.client.get(
+                reverse("comments", args=[self.listing.id]),
+                {"cursor": cursor}).json()
+            seen += re.findall(r"comment-(\d+)-", page["html"])
+            cursor = page["next_cursor"]
+        self.assertEqual(seen, [str(i) for i in range(24, -1, -1)])
+
+
+class BidHistoryTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidder = User.objects.create_user("bidder", "b@example.com", "pw")
+        self.listing = Listing.objects.create(
+            item="Clock", price=5, currency="USD",
+            category=Category.objects.create(name="Home"), created_by=seller)
+        self.start = timezone.now() - timezone.timedelta(hours=10)
+        Bid.objects.bulk_create([
+            Bid(item=self.listing, bid=10 + i, bid_by=self.bidder)
+            for i in range(120)])
+        # One bid every five minutes, for ten hours.
+        for i, bid in enumerate(Bid.objects.order_by("id")):
+            Bid.objects.filter(id=bid.id).update(
+                created=self.start + timezone.timedelta(minutes=5 * i))
+
+    def test_bid_pages_are_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page = self.client.get(
+                reverse("bids", args=[self.listing.id]),
+                {"cursor": cursor} if cursor else {}).json()
+            seen += [bid["bid"] for bid in page["bids"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [10 + i for i in range(119, -1, -1)])
+        self.assertEqual(page["bids"][0]["bid_by"], "bidder")
+        response = self.client.get(
+            reverse("bids", args=[self.listing.id]), {"cursor": "junk"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_price_history_is_downsampled(self):
+        url = reverse("price_history", args=[self.listing.id])
+        history = self.client.get(url, {"points": 10}).json()
+        self.assertEqual(len(history["points"]), 10)
+        self.assertAlmostEqual(history["bucket_seconds"], 119 * 300 / 10)
+        self.assertEqual(sum(p["bids"] for p in history["points"]), 120)
+        prices = [p["price"] for p in history["points"]]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(prices[-1], 129)
+
+        self.assertEqual(len(self.client.get(url).json()["points"]), 120)
+        self.assertEqual(self.client.get(url, {"points": 0}).status_code, 400)
+
+    def test_price_history_is_cached_until_the_next_bid(self):
+        cache.clear()
+        url = reverse("price_history", args=[self.listing.id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        place_bid(self.listing.id, self.bidder, 500)
+        self.assertEqual(self.client.get(url).json()["points"][-1]["price"], 500)
+
+    def test_empty_history(self):
+        Bid.objects.all().delete()
+        self.assertEqual(self.client.get(
+            reverse("price_history", args=[self.listing.id])).json(),
+            {"bucket_seconds": 0, "points": []})
+
+
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        seed_dataset(users=3, categories=2, listings=5, bids_per_listing=2,
+                     comments_per_listing=3, watchlist_per_user=2)
+        self.user = User.objects.first()
+        self.listing = Listing.objects.first()
+
+    def test_async_views_match_sync_views(self):
+        self.client.force_login(self.user)
+        pages = [
+            ("index", []),
+            ("listing", [self.listing.id]),
+            ("category", []),
+            ("category", [self.listing.category_id]),
+            ("watchlist", []),
+        ]
+        for name, args in pages:
+            sync = self.client.get(reverse(name, args=args))
+            response = self.async_get(reverse(f"async_{name}", args=args))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                re.sub(r'value="\w+"', "", response.content.decode()),
+                re.sub(r'value="\w+"', "", sync.content.decode()), name)
+
+    def test_async_watchlist_requires_login(self):
+        response = self.async_get(reverse("async_watchlist"), login=False)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], reverse("login"))
+
+    def async_get(self, url, login=True):
+        client = AsyncClient()
+        if login:
+            client.force_login(self.user)
+
+        async def get():
+            return await client.get(url)
+        return async_to_sync(get)()
+
+
+class EventBackendTests(TestCase):
+    def test_in_process_backend(self):
+        backend = events.InProcessBackend()
+        received = []
+        unsubscribe = backend.subscribe(1, received.append)
+        backend.publish(1, {"price": 5})
+        backend.publish(2, {"price": 6})
+        unsubscribe()
+        backend.publish(1, {"price": 7})
+        self.assertEqual(received, [{"price": 5}])
+
+    def test_sqlite_backend_shares_events_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/events.sqlite3"
+            subscriber = events.SQLiteBackend(path, poll_interval=0.01)
+            publisher = events.SQLiteBackend(path)
+            received = threading.Event()
+            subscriber.subscribe(3, lambda event: received.set())
+            publisher.publish(3, {"price": 9})
+            self.assertTrue(received.wait(5))
+
+    def test_bids_and_closing_publish_after_commit(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        listing = Listing.objects.create(
+            item="Bike", price=50, currency="USD",
+            category=Category.objects.create(name="Sport"), created_by=seller)
+        backend = events.InProcessBackend()
+        received = []
+        backend.subscribe(listing.id, received.append)
+
+        with mock.patch.object(events, "_backend", backend):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                place_bid(listing.id, seller, 60)
+                self.assertEqual(received, [])
+            # Publishing the event and invalidating cached pages.
+            self.assertEqual(len(callbacks), 2)
+
+            self.client.force_login(seller)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("close_listing", args=[listing.id]))
+
+        self.assertEqual(received, [
+            {"price": 60, "bid_count": 1, "closed": False},
+            {"price": 60, "bid_count": 1, "closed": True},
+        ])
+
+
+class ListingEventStreamTests(TransactionTestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.listing = Listing.objects.create(
+            item="Bike", price=50, currency="USD",
+            category=Category.objects.create(name="Sport"), created_by=seller)
+
+    def stream(self, on_send=None, messages=3):
+        """Return the events sent until ``messages`` messages were sent."""
+        app = with_listing_events(None)
+        sent = []
+
+        async def stream():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+                if on_send:
+                    on_send(len(sent))
+                if len(sent) == messages:
+                    disconnect.set()
+
+            try:
+                await asyncio.wait_for(app({
+                    "type": "http",
+                    "path": f"/listing/{self.listing.id}/events",
+                }, receive, send), 2)
+            except asyncio.TimeoutError:
+                pass
+
+        async_to_sync(stream)()
+        self.assertEqual(sent[0]["status"], 200)
+        return [json.loads(m["body"].decode().split("data: ")[1])
+                for m in sent[1:]]
+
+    def test_streams_current_state_then_published_events(self):
+        def on_send(count):
+            if count == 2:
+                events.publish(self.listing.id, 70, 1, False)
+
+        self.assertEqual(self.stream(on_send), [
+            {"price": 50, "bid_count": 0, "closed": False},
+            {"price": 70, "bid_count": 1, "closed": False}])
+
+    def test_events_published_while_reading_the_state_are_sent(self):
+        original = sse.read
+
+        async def read(fn):
+            listing = await original(fn)
+            # A bid that commits right after the state was read.
+            events.publish(self.listing.id, 70, 1, False)
+            return listing
+
+        with mock.patch.object(sse, "read", read):
+            self.assertEqual(self.stream(), [
+                {"price": 50, "bid_count": 0, "closed": False},
+                {"price": 70, "bid_count": 1, "closed": False}])
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.category = Category.objects.create(name="Art")
+
+    def upload(self):
+        data = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(data, "PNG")
+        self.client.force_login(self.seller)
+        with mock.patch.object(images, "schedule",
+                               side_effect=images.process_listing_image):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("listing"), {
+                    "item": "Sunset", "price": 10, "currency": "USD",
+                    "category": self.category.id,
+                    "image": SimpleUploadedFile("sunset.png", data.getvalue()),
+                })
+        return Listing.objects.get(item="Sunset")
+
+    def test_upload_generates_hashed_variants(self):
+        listing = self.upload()
+        self.assertEqual(set(listing.image_variants), {"thumb", "detail"})
+        self.assertEqual(set(listing.thumbnail), {"webp", "jpeg"})
+        thumb = Image.open(f"{self.media.name}/{images.VARIANT_DIR}/"
+                           f"{listing.thumbnail['jpeg']}")
+        self.assertEqual(thumb.size, (300, 150))
+
+        response = self.client.get(
+            reverse("image_variant", args=[listing.thumbnail["webp"]]))
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        index = self.client.get(reverse("index"))
+        self.assertContains(
+            index, reverse("image_variant", args=[listing.thumbnail["webp"]]))
+
+    def test_same_image_reuses_variant_files(self):
+        first = self.upload()
+        Listing.objects.filter(id=first.id).update(item="Sunrise")
+        second = self.upload()
+        self.assertEqual(first.image_variants, second.image_variants)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_images_too_large_to_decode_are_skipped(self):
+        with self.assertLogs("auctions.images", "WARNING"):
+            listing = self.upload()
+        self.assertEqual(listing.image_variants, {})
+
+    def test_unknown_variant_names_are_not_found(self):
+        for name in ["missing-thumb.webp", "..secret"]:
+            response = self.client.get(reverse("image_variant", args=[name]))
+            self.assertEqual(response.status_code, 404)
+
+
+fetched = []
+
+
+def stub_fetch(url):
+    """IMAGE_PROXY_FETCHER for tests: a 1600x800 PNG, slow to arrive."""
+    fetched.append(url)
+    if "missing" in url:
+        raise image_proxy.FetchError(url)
+    threading.Event().wait(0.05)
+    data = io.BytesIO()
+    Image.new("RGB", (1600, 800), "blue").save(data, "PNG")
+    return data.getvalue()
+
+
+class ImageProxyTests(TestCase):
+    URL = "https://images.example.com/lamp.png"
+
+    def setUp(self):
+        self.cache = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache.cleanup)
+        override = override_settings(
+            IMAGE_PROXY_FETCHER="auctions.tests.stub_fetch",
+            IMAGE_PROXY_CACHE_DIR=self.cache.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        fetched.clear()
+
+    def get(self, url=None, variant="thumb", **headers):
+        return self.client.get(
+            image_proxy.proxy_url(url or self.URL, variant), **headers)
+
+    def test_fetches_each_url_once(self):
+        thumb = self.get(HTTP_ACCEPT="image/webp,*/*")
+        self.assertEqual(thumb["Content-Type"], "image/webp")
+        self.assertEqual(Image.open(io.BytesIO(thumb.content)).size, (300, 150))
+        detail = self.get(variant="detail")
+        self.assertEqual(detail["Content-Type"], "image/jpeg")
+        self.assertEqual(
+            Image.open(io.BytesIO(detail.content)).size, (1200, 600))
+        self.get()
+        self.assertEqual(fetched, [self.URL])
+
+    def test_coalesces_concurrent_misses(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            image_proxy.proxied_image(self.URL, "thumb", "jpeg")))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetched, [self.URL])
+        self.assertEqual(len(set(results)), 1)
+
+    def test_etag_and_not_modified(self):
+        response = self.get()
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertEqual(response["Vary"], "Accept")
+        again = self.get(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+    def test_refuses_internal_hosts(self):
+        addresses = {
+            "localhost": ["127.0.0.1"], "intranet": ["10.1.2.3"],
+            "metadata": ["169.254.169.254"], "mapped": ["::ffff:192.168.0.1"],
+            "mixed": ["93.184.216.34", "172.16.0.1"],
+        }
+        with mock.patch.object(image_proxy, "resolve",
+                               lambda host, port: addresses[host]), \
+                mock.patch.object(image_proxy.socket, "create_connection") \
+                as connect:
+            for url in ["http://localhost/a.png", "https://intranet/a.png",
+                        "http://metadata/latest/meta-data/",
+                        "http://mapped/a.png", "http://mixed/a.png",
+                        "ftp://example.com/a.png", "file:///etc/passwd"]:
+                with self.assertRaises(image_proxy.FetchError, msg=url):
+                    image_proxy.fetch_url(url)
+        connect.assert_not_called()
+
+    def test_redirects_are_checked_at_every_hop(self):
+        class Response:
+            status = 302
+
+            def getheader(self, name):
+                return "http://metadata/latest/meta-data/"
+
+        addresses = {"images.example.com": ["93.184.216.34"],
+                     "metadata": ["169.254.169.254"]}
+        with mock.patch.object(image_proxy, "resolve",
+                               lambda host, port: addresses[host]), \
+                mock.patch.object(image_proxy.PinnedHTTPConnection,
+                                  "request"), \
+                mock.patch.object(image_proxy.PinnedHTTPConnection,
+                                  "getresponse", return_value=Response()) \
+                as getresponse:
+            with self.assertRaisesRegex(image_proxy.FetchError, "not public"):
+                image_proxy.fetch_url("http://images.example.com/a.png")
+        self.assertEqual(getresponse.call_count, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = image_proxy.DiskCache(self.cache.name, max_bytes=35)
+        for name in "abc":
+            cache.write(name, b"x" * 10)
+            os.utime(os.path.join(self.cache.name, name),
+                     ns=(0, "abc".index(name) * 10 ** 9))
+        cache.read("a")
+        cache.write("d", b"x" * 10)
+        self.assertEqual(sorted(os.listdir(self.cache.name)), ["a", "c", "d"])
+
+    def test_rejects_unsigned_and_failing_urls(self):
+        response = self.client.get(reverse("image_proxy", args=["thumb"]),
+                                   {"url": self.URL, "sig": "forged"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.get("https://images.example.com/missing.png").status_code, 502)
+        self.assertEqual(fetched, ["https://images.example.com/missing.png"])
+
+    def test_rejects_images_too_large_to_decode(self):
+        # 24 KB of PNG declaring 14000x14000 pixels.
+        bomb = io.BytesIO()
+        Image.new("1", (14000, 14000)).save(bomb, "PNG")
+        with mock.patch.object(image_proxy, "get_fetcher",
+                               return_value=lambda url: bomb.getvalue()):
+            self.assertEqual(self.get().status_code, 502)
+        with override_settings(IMAGE_MAX_PIXELS=1000 * 1000):
+            self.assertEqual(self.get(
+                "https://images.example.com/large.png").status_code, 502)
+        self.assertEqual(self.get(
+            "https://images.example.com/large.png").status_code, 200)
+
+    def test_listing_rows_use_the_proxy(self):
+        Listing.objects.create(
+            item="Lamp", price=10, currency="USD", image_url=self.URL,
+            category=Category.objects.create(name="Home"),
+            created_by=User.objects.create_user("seller", "s@x.com", "pw"))
+        index = self.client.get(reverse("index"))
+        self.assertContains(index, image_proxy.proxy_url(self.URL, "thumb")
+                            .replace("&", "&amp;"))
+
+
+class PageCacheMixin:
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidder = User.objects.create_user("bidder", "b@example.com", "pw")
+        self.category = Category.objects.create(name="Home")
+        self.listing = Listing.objects.create(
+            item="Lamp", price=10, currency="USD", category=self.category,
+            created_by=self.seller)
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in [reverse("index"), reverse("listing", args=[self.listing.id]),
+                    reverse("category", args=[self.category.id])]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+
+    def test_bids_comments_and_closing_invalidate(self):
+        index = reverse("index")
+        page = reverse("listing", args=[self.listing.id])
+        self.client.get(index)
+        self.client.get(page)
+
+        place_bid(self.listing.id, self.bidder, 25)
+        self.assertContains(self.client.get(index), "USD 25")
+        self.assertContains(self.client.get(page), "25")
+
+        Comment.objects.create(item=self.listing, content="Still works?",
+                               created_by=self.bidder)
+        self.assertContains(self.client.get(page), "Still works?")
+
+        self.client.force_login(self.seller)
+        self.client.post(reverse("close_listing", args=[self.listing.id]))
+        self.client.logout()
+        self.assertContains(self.client.get(page), "winner of this auction")
+        self.assertNotContains(self.client.get(index), "Lamp")
+
+    def test_logged_in_pages_reuse_row_fragments(self):
+        self.client.force_login(self.bidder)
+        self.client.get(reverse("index"))
+        Listing.objects.filter(id=self.listing.id).update(item="Desk")
+        # Not a tracked change, so the row is still the cached one ...
+        self.assertContains(self.client.get(reverse("index")), "Lamp")
+        caching.listings_changed(self.listing.id)
+        self.assertContains(self.client.get(reverse("index")), "Desk")
+
+    def test_versions_survive_eviction(self):
+        version = caching.listing_version(self.listing.id)
+        cache.delete(caching.listing_key(self.listing.id))
+        self.assertNotEqual(caching.listing_version(self.listing.id), version)
+
+
+@override_settings(CACHES={"default": {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class LocMemPageCacheTests(PageCacheMixin, TestCase):
+    pass
+
+
+class FilePageCacheTests(PageCacheMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": directory.name}})
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            # WAL only when configured, which is in production by default.
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS.get(
+                "journal_mode", "delete"))
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_does_not_retry_inside_a_transaction(self):
+        write = mock.Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError), transaction.atomic():
+            retry_on_lock(write)()
+        self.assertEqual(write.call_count, 1)
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_empty_runs_are_summarized(self):
+        summary = summarize([], [], {}, 1.0)
+        self.assertEqual(summary["requests"], 0)
+        self.assertIsNone(summary["p99_ms"])
+        self.assertIsNone(summary["queries_per_request"])
+
+    def test_failures_are_left_out_of_latencies(self):
+        summary = summarize([40.0], [3], {200: 1, 500: 2}, 1.0)
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(summary["statuses"], {200: 1, 500: 2})
+        self.assertEqual(summary["throughput_rps"], 1)
+        self.assertEqual(summary["p50_ms"], 40.0)
+
+    def test_requests_must_be_positive(self):
+        with self.assertRaisesRegex(CommandError, "at least 1"):
+            call_command("benchmark", "--skip-seed", "--requests", "0")
+
+
+class AsyncBenchmarkTests(TransactionTestCase):
+    def test_bids_are_posted_over_asgi(self):
+        seed_dataset(users=2, categories=1, listings=2, bids_per_listing=0,
+                     comments_per_listing=0, watchlist_per_user=0)
+        listing = Listing.objects.first()
+        amounts = iter(range(1000, 2000))
+
+        def make_request(rng):
+            return "post", reverse("bid"), {
+                "item": listing.id, "bid": next(amounts)}
+
+        result = benchmark.Command().run_route_async(
+            make_request, list(User.objects.all()), 4, 2)
+        self.assertEqual(result["statuses"], {302: 4})
+        self.assertEqual(Bid.objects.filter(item=listing).count(), 4)
+
+
+class RetryOnLockTests(SimpleTestCase):
+    @override_settings(SQLITE_LOCK_RETRIES=2)
+    def test_retries_locked_writes(self):
+        write = mock.Mock(side_effect=[
+            OperationalError("database is locked"), "done"])
+        self.assertEqual(retry_on_lock(write)(), "done")
+        self.assertEqual(write.call_count, 2)
+
+        write = mock.Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            retry_on_lock(write)()
+        self.assertEqual(write.call_count, 3)
+
+        write = mock.Mock(side_effect=OperationalError("no such table: x"))
+        with self.assertRaises(OperationalError):
+            retry_on_lock(write)()
+        self.assertEqual(write.call_count, 1)
+
+
+class ProductionChecksTests(SimpleTestCase):
+    def warning_ids(self):
+        return {w.id for w in checks.check_production_settings(None)}
+
+    def test_development_profile_is_not_checked(self):
+        self.assertEqual(self.warning_ids(), set())
+
+    @override_settings(PROFILE="production", DEBUG=True)
+    def test_development_defaults_are_flagged_in_production(self):
+        self.assertEqual(self.warning_ids(), {
+            "auctions.W001", "auctions.W002", "auctions.W004",
+            "auctions.W005", "auctions.W006", "auctions.W007",
+            "auctions.W008"})
+
+    @override_settings(
+        PROFILE="production", DEBUG=False,
+        STATICFILES_STORAGE="django.contrib.staticfiles.storage."
+                            "ManifestStaticFilesStorage",
+        SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+        AUTHENTICATION_BACKENDS=["auctions.auth.CachedModelBackend"],
+        CACHES={"default": {"BACKEND": "django.core.cache.backends."
+                                       "filebased.FileBasedCache",
+                            "LOCATION": tempfile.gettempdir()}},
+        SQLITE_PRAGMAS={"journal_mode": "delete"},
+        TEMPLATES=[{"BACKEND": "auctions.instrumentation.TimedDjangoTemplates",
+                    "APP_DIRS": True}])
+    def test_production_settings(self):
+        # Without explicit loaders Django caches templates once DEBUG is off.
+        self.assertEqual(self.warning_ids(), {"auctions.W004"})
+        with override_settings(DATABASES={"default": {
+                "ENGINE": "django.db.backends.sqlite3", "CONN_MAX_AGE": 0}}):
+            self.assertIn("auctions.W003", self.warning_ids())
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=["auctions.auth.CachedModelBackend"],
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db")
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", "a@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def test_signed_in_requests_skip_session_and_user_queries(self):
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "Signed in as <strong>alice</strong>")
+        self.assertEqual(
+            [q["sql"] for q in queries
+             if "auctions_user" in q["sql"] or "django_session" in q["sql"]],
+            [])
+
+    def test_saving_a_user_invalidates_it(self):
+        self.client.get(reverse("index"))
+        self.user.username = "alicia"
+        self.user.save()
+        self.assertContains(self.client.get(reverse("index")), "alicia")
+
+        self.user.set_password("new password")
+        self.user.save()
+        self.assertNotContains(self.client.get(reverse("index")), "Signed in")
+
+    def test_deactivated_users_are_signed_out(self):
+        self.client.get(reverse("index"))
+        self.user.is_active = False
+        self.user.save()
+        self.assertNotContains(self.client.get(reverse("index")), "Signed in")
+
+    @override_settings(
+        SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(reverse("index")), "alice")
+        self.assertFalse(any("django_session" in q["sql"] for q in queries))
+
+
+class WatchlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", "a@example.com", "pw")
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        category = Category.objects.create(name="Home")
+        self.listings = [Listing.objects.create(
+            item=f"Item {n}", price=10 + n, currency="USD", category=category,
+            created_by=seller) for n in range(5)]
+        self.client.force_login(self.user)
+
+    def bulk(self, **body):
+        return self.client.post(reverse("watchlist_bulk"), json.dumps(body),
+                                content_type="application/json")
+
+    def test_items_are_unique_per_user(self):
+        item = self.listings[0].id
+        for _ in range(2):
+            self.client.post(reverse("watchlist"), {"item": item})
+        self.assertEqual(Watchlist.objects.filter(user=self.user).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Watchlist.objects.create(user=self.user, item_id=item)
+
+    def test_watchlist_page_queries_do_not_grow(self):
+        self.bulk(add=[self.listings[0].id])
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(reverse("watchlist"))
+        self.bulk(add=[listing.id for listing in self.listings])
+        with CaptureQueriesContext(connection) as five:
+            response = self.client.get(reverse("watchlist"))
+        self.assertEqual(len(one), len(five))
+        self.assertContains(response, "USD 14.0")
+
+    def test_watch_state_comes_from_the_cache(self):
+        watched, other = self.listings[0], self.listings[1]
+        self.client.post(reverse("watchlist"), {"item": watched.id})
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as queries:
+            index = self.client.get(reverse("index"))
+            page = self.client.get(reverse("listing", args=[watched.id]))
+        self.assertFalse(
+            any("auctions_watchlist" in q["sql"] for q in queries))
+        self.assertContains(index, "In your watchlist", count=1)
+        self.assertContains(page, "In your watchlist")
+        self.assertNotContains(
+            self.client.get(reverse("listing", args=[other.id])),
+            "In your watchlist")
+
+        self.client.post(reverse("watchlist"),
+                         {"item": watched.id, "delete": True})
+        self.assertNotContains(
+            self.client.get(reverse("index")), "In your watchlist")
+
+    def test_bulk_add_and_remove(self):
+        ids = [listing.id for listing in self.listings]
+        response = self.bulk(add=ids[:3] + [9999])
+        self.assertEqual(response.json(), {
+            "added": ids[:3], "removed": [], "unknown": [9999], "watching": 3})
+
+        response = self.bulk(add=ids[2:], remove=ids[:2])
+        self.assertEqual(response.json(), {
+            "added": ids[3:], "removed": ids[:2], "unknown": [],
+            "watching": 3})
+        self.assertContains(self.client.get(reverse("index")),
+                            "In your watchlist", count=3)
+
+    def test_bulk_rejects_bad_requests(self):
+        self.assertEqual(self.bulk(add="x").status_code, 400)
+        self.assertEqual(self.bulk(add=[1], remove=[1]).status_code, 400)
+        for id in [1.5, True, "1", None, 0, 2 ** 63]:
+            self.assertEqual(self.bulk(add=[id]).status_code, 400, id)
+            self.assertEqual(self.bulk(remove=[id]).status_code, 400, id)
+        self.assertFalse(Watchlist.objects.filter(user=self.user).exists())
+        self.assertEqual(self.client.get(reverse("watchlist_bulk")).status_code,
+                         405)
+        self.client.logout()
+        self.assertEqual(self.bulk(add=[1]).status_code, 401)
+
+
+class CategoryBrowsingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.art, self.home = [Category.objects.create(name=name)
+                               for name in ["Art", "Home"]]
+        self.listings = [Listing.objects.create(
+            item=f"Painting {n}", price=10, currency="USD", category=self.art,
+            created_by=self.seller) for n in range(5)]
+        Listing.objects.filter(id=self.listings[0].id).update(closed=True)
+        caching.listings_changed(self.listings[0].id, catalog=True)
+
+    def test_category_pages_list_open_listings_only(self):
+        with mock.patch.object(views, "LISTINGS_PER_PAGE", 3):
+            first = self.client.get(reverse("category", args=[self.art.id]))
+            self.assertEqual([l.item for l in first.context["listings"]],
+                             ["Painting 4", "Painting 3", "Painting 2"])
+            second = self.client.get(
+                reverse("category", args=[self.art.id]),
+                {"cursor": first.context["next_cursor"]})
+        self.assertEqual([l.item for l in second.context["listings"]],
+                         ["Painting 1"])
+        self.assertIsNone(second.context["next_cursor"])
+
+        response = self.client.get(reverse("category", args=[self.art.id]),
+                                   {"cursor": "bogus"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_counts_come_from_one_cached_query(self):
+        with self.assertNumQueries(1):
+            categories = views.category_counts()
+        self.assertEqual([(c.name, c.open_listings) for c in categories],
+                         [("Art", 4), ("Home", 0)])
+        self.assertContains(self.client.get(reverse("category")), "4 open")
+
+        place_bid(self.listings[1].id, self.seller, 20)
+        with self.assertNumQueries(0):
+            views.category_counts()
+
+        self.listings[1].closed = True
+        self.listings[1].save()
+        self.assertEqual(views.category_counts()[0].open_listings, 3)
+
+    def test_open_feeds_are_read_in_index_order(self):
+        for queryset, index in [
+                (Listing.objects.filter(closed=False), "listing_open_feed_idx"),
+                (Listing.objects.filter(category=self.art, closed=False),
+                 "listing_category_open_idx")]:
+            plan = queryset.order_by("-created", "-id")[:25].explain()
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+class ExpiryTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidders = [User.objects.create_user(f"b{n}", f"b{n}@x.com", "pw")
+                        for n in range(2)]
+        self.category = Category.objects.create(name="Home")
+        self.now = timezone.now()
+
+    def listing(self, ends_in, **kwargs):
+        return Listing.objects.create(
+            item="Lamp", price=10, currency="USD", category=self.category,
+            created_by=self.seller, ends_at=self.now + ends_in, **kwargs)
+
+    def test_closes_expired_listings_in_batches(self):
+        hour = timezone.timedelta(hours=1)
+        expired = [self.listing(-hour) for _ in range(5)]
+        running = self.listing(hour)
+        unlimited = Listing.objects.create(
+            item="Vase", price=5, currency="USD", category=self.category,
+            created_by=self.seller)
+        Listing.objects.filter(id=expired[0].id).update(ends_at=self.now)
+        # Bid while the listing still runs, then let it expire.
+        Listing.objects.filter(id=expired[1].id).update(ends_at=None)
+        place_bid(expired[1].id, self.bidders[0], 20)
+        place_bid(expired[1].id, self.bidders[1], 30)
+        Listing.objects.filter(id=expired[1].id).update(
+            ends_at=self.now - hour)
+
+        with self.assertNumQueries(6):
+            # Select the batch, find winners (one grouped query), record
+            # results and close, inside a savepoint.
+            batch = close_expired_batch(self.now, batch_size=2)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(close_expired(self.now, batch_size=2), 3)
+
+        self.assertEqual(
+            set(Listing.objects.filter(closed=True).values_list(
+                "id", flat=True)), {l.id for l in expired})
+        self.assertFalse(Listing.objects.get(id=running.id).closed)
+        self.assertFalse(Listing.objects.get(id=unlimited.id).closed)
+
+        result = AuctionResult.objects.get(listing=expired[1])
+        self.assertEqual((result.winner, result.price),
+                         (self.bidders[1], 30))
+        self.assertEqual(result.winning_bid.bid, 30)
+        self.assertIsNone(AuctionResult.objects.get(listing=expired[2]).winner)
+
+    def test_results_are_recorded_once(self):
+        listing = self.listing(timezone.timedelta(minutes=1))
+        place_bid(listing.id, self.bidders[0], 20)
+        Listing.objects.filter(id=listing.id).update(ends_at=self.now)
+        self.client.force_login(self.seller)
+        self.client.post(reverse("close_listing", args=[listing.id]))
+
+        expiry.record_results([listing.id])
+        self.assertEqual(close_expired(self.now), 0)
+        self.assertEqual(AuctionResult.objects.filter(listing=listing).count(), 1)
+        self.assertEqual(AuctionResult.objects.get().winner, self.bidders[0])
+
+    def test_bids_after_the_end_are_rejected(self):
+        listing = self.listing(timezone.timedelta(minutes=1))
+        self.assertIsNotNone(place_bid(listing.id, self.bidders[0], 20))
+        Listing.objects.filter(id=listing.id).update(ends_at=self.now)
+        self.assertIsNone(place_bid(listing.id, self.bidders[1], 30))
+
+    def test_end_time_must_be_in_the_future(self):
+        form = views.NewListingForm({
+            "item": "Lamp", "price": 10, "currency": "USD",
+            "category": self.category.id, "ends_at": "2000-01-01T10:00"})
+        self.assertIn("ends_at", form.errors)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.bidder = User.objects.create_user("bidder", "b@example.com", "pw")
+        self.category = Category.objects.create(name="Home")
+        self.listings = [Listing.objects.create(
+            item=f"Lamp {i}", price=10, currency="USD", category=self.category,
+            created_by=self.seller) for i in range(3)]
+        self.listing = self.listings[0]
+
+    def get(self, name, *args, **headers):
+        return self.client.get(reverse(name, args=args), **headers)
+
+    def test_listing_is_not_rendered_again_until_it_changes(self):
+        response = self.get("api_listing", self.listing.id)
+        self.assertEqual(response.json()["created_by"], "seller")
+        self.assertIsNone(response.json()["top_bidder"])
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+
+        with self.assertNumQueries(0):
+            response = self.get("api_listing", self.listing.id,
+                                HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        place_bid(self.listing.id, self.bidder, 20)
+        response = self.get("api_listing", self.listing.id,
+                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["price"], 20)
+        self.assertEqual(response.json()["top_bidder"], "bidder")
+        self.assertNotEqual(response["ETag"], etag)
+
+        self.assertEqual(self.get("api_listing", 0).status_code, 404)
+
+    def test_listings_feed(self):
+        with self.assertNumQueries(1):
+            response = self.get("api_listings")
+        listings = response.json()["listings"]
+        self.assertEqual([l["id"] for l in listings],
+                         [l.id for l in reversed(self.listings)])
+        self.assertEqual(set(listings[0]), {
+            "id", "item", "currency", "price", "bids", "closed", "ends_at",
+            "category", "thumbnail"})
+        self.assertEqual(self.get(
+            "api_listings", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            304)
+        Listing.objects.create(
+            item="Vase", price=5, currency="USD", category=self.category,
+            created_by=self.seller)
+        self.assertEqual(self.get(
+            "api_listings", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            200)
+        self.assertEqual(self.client.post(reverse("api_listings")).status_code,
+                         405)
+
+    def test_bids_and_comments_send_last_modified(self):
+        place_bid(self.listing.id, self.bidder, 20)
+        Comment.objects.create(
+            item=self.listing, content="Nice", created_by=self.bidder)
+        for name in ["api_bids", "api_comments"]:
+            response = self.get(name, self.listing.id)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Last-Modified", response)
+            with self.assertNumQueries(1):
+                response = self.get(
+                    name, self.listing.id,
+                    HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            self.get("api_bids", self.listing.id).json()["bids"][0]["bid_by"],
+            "bidder")
+
+    def test_etag_polls_skip_last_modified(self):
+        place_bid(self.listing.id, self.bidder, 20)
+        for name in ["api_bids", "api_comments"]:
+            etag = self.get(name, self.listing.id)["ETag"]
+            with self.assertNumQueries(0):
+                response = self.get(name, self.listing.id,
+                                    HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_unknown_listings_are_not_found(self):
+        missing = self.listings[-1].id + 1
+        for name in ["api_listing", "api_bids", "api_comments"]:
+            response = self.get(name, missing)
+            self.assertEqual(response.status_code, 404, name)
+            self.assertEqual(response.json(), {"error": "No such listing."})
+        self.assertIsNone(cache.get(caching.listing_key(missing)))
+
+    def test_categories(self):
+        response = self.get("api_categories")
+        self.assertEqual(response.json(), {"categories": [
+            {"id": self.category.id, "name": "Home", "open_listings": 3}]})
+        self.assertEqual(self.get(
+            "api_categories", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            304)
+
+    def test_watchlist(self):
+        self.assertEqual(self.get("api_watchlist").status_code, 401)
+        self.client.force_login(self.bidder)
+        Watchlist.objects.create(user=self.bidder, item=self.listing)
+        response = self.get("api_watchlist")
+        self.assertEqual([l["id"] for l in response.json()["listings"]],
+                         [self.listing.id])
+        etag = response["ETag"]
+        self.assertEqual(self.get(
+            "api_watchlist", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        place_bid(self.listing.id, self.seller, 30)
+        response = self.get("api_watchlist", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()["listings"][0]["price"], 30)
+        etag = response["ETag"]
+        Watchlist.objects.create(user=self.bidder, item=self.listings[1])
+        self.assertEqual(self.get(
+            "api_watchlist", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user("seller", "s@example.com", "pw")
+        self.home = Category.objects.create(name="Home")
+        self.toys = Category.objects.create(name="Toys")
+        for i, (category, currency, price) in enumerate([
+                (self.home, "USD", 5), (self.home, "USD", 20),
+                (self.home, "EUR", 75), (self.toys, "USD", 30),
+                (self.toys, "EUR", 2000)]):
+            Listing.objects.create(
+                item=f"Item {i}", price=price, currency=currency,
+                category=category, created_by=seller)
+        Listing.objects.create(
+            item="Sold", price=40, currency="USD", category=self.toys,
+            created_by=seller, closed=True)
+
+    def index(self, **params):
+        return self.client.get(reverse("index"), params)
+
+    def counts(self, response):
+        return {facet["name"]: {o["label"]: o["count"] for o in facet["options"]}
+                for facet in response.context["facets"]}
+
+    def test_filters(self):
+        for params, items in [
+                ({"currency": "usd"}, {"Item 0", "Item 1", "Item 3"}),
+                ({"category": self.toys.id}, {"Item 3", "Item 4"}),
+                ({"min_price": "10", "max_price": "50"}, {"Item 1", "Item 3"}),
+                ({"currency": "USD", "min_price": "25"}, {"Item 3"}),
+                ({"status": "closed"}, {"Sold"})]:
+            response = self.index(**params)
+            self.assertEqual(
+                {l.item for l in response.context["listings"]}, items, params)
+
+    def test_facet_counts_ignore_their_own_filter(self):
+        with self.assertNumQueries(5):
+            # The page, then counts per category (and their names), per
+            # currency and per price range.
+            response = self.index(currency="USD")
+        self.assertEqual(self.counts(response), {
+            "Category": {"Home": 2, "Toys": 1},
+            "Currency": {"EUR": 2, "USD": 3},
+            "Price": {"0–10": 1, "10–50": 2},
+        })
+        currency = response.context["facets"][1]
+        self.assertEqual(currency["any"], "")
+        self.assertEqual([o["selected"] for o in currency["options"]],
+                         [False, True])
+        self.assertEqual(currency["options"][0]["query"], "currency=EUR")
+
+        price = response.context["facets"][2]["options"][1]
+        self.assertEqual(price["query"],
+                         "currency=USD&min_price=10&max_price=50")
+        self.assertEqual(self.counts(self.index(status="closed"))["Price"],
+                         {"10–50": 1})
+        self.assertEqual(self.counts(self.index())["Price"],
+                         {"0–10": 1, "10–50": 2, "50–100": 1, "1000+": 1})
+
+    def test_price_filters_follow_bids(self):
+        listing = Listing.objects.get(item="Item 1")
+        place_bid(listing.id, User.objects.get(), 60)
+        for params, items in [
+                ({"min_price": "50", "max_price": "100"}, {"Item 1", "Item 2"}),
+                ({"min_price": "25", "max_price": "70"}, {"Item 1", "Item 3"}),
+                ({"min_price": "60.5"}, {"Item 2", "Item 4"}),
+                ({"max_price": "10"}, {"Item 0"}),
+                ({"min_price": "70", "max_price": "25"}, set())]:
+            response = self.index(**params)
+            self.assertEqual(
+                {l.item for l in response.context["listings"]}, items, params)
+        self.assertEqual(self.counts(self.index())["Price"],
+                         {"0–10": 1, "10–50": 1, "50–100": 2, "1000+": 1})
+
+    def test_pages_keep_their_filters(self):
+        with mock.patch.object(views, "LISTINGS_PER_PAGE", 1):
+            response = self.index(currency="USD")
+        self.assertContains(response, "?currency=USD&amp;cursor=")
+
+    def test_precise_prices_keep_their_own_pages(self):
+        Listing.objects.filter(item="Item 4").update(current_price=12345.67)
+        for price, items in [("12345.67", {"Item 4"}), ("12345.7", set())]:
+            response = self.index(min_price=price)
+            self.assertEqual(
+                {l.item for l in response.context["listings"]}, items, price)
+            self.assertEqual(response.context["filter_query"],
+                             f"min_price={price}")
+        self.assertEqual(facets.query_string({"min_price": 1234567.5}),
+                         "min_price=1234567.5")
+
+    def test_invalid_filters(self):
+        for params in [{"status": "sold"}, {"category": "x"},
+                       {"category": "99999999999999999999"}, {"category": "-1"},
+                       {"currency": "US1"}, {"min_price": "nan"},
+                       {"max_price": "cheap"}]:
+            self.assertEqual(self.index(**params).status_code, 400, params)
+
+    def test_category_and_currency_counts_survive_bids(self):
+        self.index()
+        listing = Listing.objects.get(item="Item 0")
+        place_bid(listing.id, User.objects.get(), 15)
+        with self.assertNumQueries(2):
+            # The page and the price counts.
+            response = self.index()
+        self.assertEqual(self.counts(response)["Price"]["10–50"], 3)
+
+    def test_counts_survive_bids_within_a_price_range(self):
+        for params in [{}, {"min_price": "10", "max_price": "50"}]:
+            self.index(**params)
+        listing = Listing.objects.get(item="Item 1")
+        place_bid(listing.id, User.objects.get(), 30)
+        for params in [{}, {"min_price": "10", "max_price": "50"}]:
+            with self.assertNumQueries(1):
+                # Only the page.
+                self.index(**params)
+
+    def test_counts_under_bounds_within_a_price_range_follow_bids(self):
+        self.assertEqual(self.counts(self.index(min_price="25"))["Currency"],
+                         {"EUR": 2, "USD": 1})
+        listing = Listing.objects.get(item="Item 1")
+        place_bid(listing.id, User.objects.get(), 30)
+        self.assertEqual(self.counts(self.index(min_price="25"))["Currency"],
+                         {"EUR": 2, "USD": 2})
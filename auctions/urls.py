@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -9,11 +9,37 @@ urlpatterns = [
     path("register", views.register, name="register"),
     path("listing", views.listing, name="listing"),
     path("listing/<int:id>", views.listing, name="listing"),
+    path("listing/<int:id>/comments", views.comments, name="comments"),
+    path("listing/<int:id>/bids", views.bids, name="bids"),
+    path("listing/<int:id>/price-history", views.price_history,
+         name="price_history"),
+    path("listing/<int:id>/events", views.listing_events, name="listing_events"),
     path("listing/create", views.create_listing, name="create_listing"),
     path("listing/close/<int:id>", views.close_listing, name="close_listing"),
     path("bid", views.bid, name="bid"),
+    path("bid/proxy", views.proxy_bid, name="proxy_bid"),
     path("comment", views.comment, name="comment"),
     path("watchlist", views.watchlist, name="watchlist"),
+    path("watchlist/bulk", views.watchlist_bulk, name="watchlist_bulk"),
     path("category", views.category, name="category"),
     path("category/<int:id>", views.category, name="category"),
+    path("search", views.search, name="search"),
+    path("stats", views.performance_stats, name="performance_stats"),
+    path("export/<str:kind>", views.export, name="export"),
+    path("images/<str:name>", views.image_variant, name="image_variant"),
+    path("image-proxy/<str:variant>", views.proxied_image, name="image_proxy"),
+
+    # Async read path, for deployments served through commerce.asgi.
+    path("async/", async_views.index, name="async_index"),
+    path("async/listing/<int:id>", async_views.listing, name="async_listing"),
+    path("async/category", async_views.category, name="async_category"),
+    path("async/category/<int:id>", async_views.category, name="async_category"),
+    path("async/watchlist", async_views.watchlist, name="async_watchlist"),
+
+    path("api/listings", api.listings, name="api_listings"),
+    path("api/listings/<int:id>", api.listing, name="api_listing"),
+    path("api/listings/<int:id>/bids", api.bids, name="api_bids"),
+    path("api/listings/<int:id>/comments", api.comments, name="api_comments"),
+    path("api/categories", api.categories, name="api_categories"),
+    path("api/watchlist", api.watchlist, name="api_watchlist"),
 ]
@@ -1,26 +1,61 @@
+import hashlib
+import json
+import re
+
 from django import forms
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotFound, HttpResponseBadRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, HttpResponseNotFound, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
 from django.shortcuts import redirect
+from django.utils.http import parse_etags
+
 
+from . import caching, facets, history, image_proxy, images
+from .bidding import place_bid, place_proxy_bid
+from .database import MAX_INTEGER, retry_on_lock
+from .events import publish_listing
+from .expiry import record_results
+from .exports import CONTENT_TYPES, InvalidExport, export_rows, parse_filters, render_rows
+from .middleware import rolling_stats
+from .models import Bid, Comment, Listing, ProxyBid, User, Watchlist, Category
+from .pagination import InvalidCursor, keyset_page
+from .search import search_listings
 
-from .models import Bid, Comment, Listing, User, Watchlist, Category
+LISTINGS_PER_PAGE = 25
+COMMENTS_PER_PAGE = 20
+BIDS_PER_PAGE = 50
+PRICE_HISTORY_POINTS = 200
+MAX_PRICE_HISTORY_POINTS = 1000
+MAX_BULK_WATCHLIST = 1000
+IMAGE_VARIANT_NAME = re.compile(r"[0-9a-f]+-\w+\.(webp|jpeg)")
 
 
 class NewListingForm(forms.ModelForm):
     class Meta:
         model = Listing
         fields = ["item", "description", "price",
-                  "currency", "image_url", "category"]
+                  "currency", "image", "image_url", "category", "ends_at"]
         widgets = {
             "item": forms.TextInput(attrs={"class": "listing_form"}),
             "description": forms.TextInput(attrs={"class": "listing_form"}),
-            "currency": forms.TextInput(attrs={"class": "listing_form"})
+            "currency": forms.TextInput(attrs={"class": "listing_form"}),
+            "ends_at": forms.DateTimeInput(attrs={"type": "datetime-local"}),
         }
 
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data.get("ends_at")
+        if ends_at is not None and ends_at <= timezone.now():
+            raise forms.ValidationError("The end time must be in the future.")
+        return ends_at
+
 
 class BidForm(forms.ModelForm):
     class Meta:
@@ -31,6 +66,15 @@ class BidForm(forms.ModelForm):
         }
 
 
+class ProxyBidForm(forms.ModelForm):
+    class Meta:
+        model = ProxyBid
+        fields = ["item", "maximum"]
+        widgets = {
+            "item": forms.HiddenInput
+        }
+
+
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
@@ -52,15 +96,31 @@ class WatchlistForm(forms.ModelForm):
 
 
 def index(request):
-    items = []
-    for listing in Listing.objects.all():
-        bids = Bid.objects.filter(item=listing)
-        price = max(bids, key=lambda b: b.bid).bid if bids else listing.price
-        items.append((listing, price))
-
-    return render(request, "auctions/index.html", {
-        "items": items
-    })
+    cursor = request.GET.get("cursor")
+    try:
+        filters = facets.parse_filters(request.GET)
+    except facets.InvalidFilter:
+        return HttpResponseBadRequest("Invalid filter!")
+    query = facets.query_string(filters)
+
+    def render_page():
+        try:
+            listings, next_cursor = facets.feed_page(
+                filters, cursor, LISTINGS_PER_PAGE)
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor!")
+
+        return render(request, "auctions/index.html", {
+            "listings": caching.with_versions(listings),
+            "next_cursor": next_cursor,
+            "watched": caching.watched_listing_ids(request.user),
+            "filters": filters,
+            "filter_query": query,
+            "facets": facets.facet_counts(filters),
+        })
+
+    return caching.cached_page(
+        request, ("index", caching.feed_version(), query, cursor), render_page)
 
 
 def login_view(request):
@@ -115,45 +175,122 @@ def register(request):
         return render(request, "auctions/register.html")
 
 
+@retry_on_lock
 def listing(request, id=0):
     if request.method == "POST":
-        form = NewListingForm(request.POST)
+        form = NewListingForm(request.POST, request.FILES)
         if form.is_valid():
             obj = form.save(commit=False)
             obj.created_by = request.user
             obj.save()
+            if obj.image:
+                transaction.on_commit(lambda: images.schedule(obj.id))
             return HttpResponseRedirect(reverse("index"))
     else:
-        item = Listing.objects.get(id=id)
-        bids = Bid.objects.filter(item=item)
-        is_max_bid = request.user.id is not None and bids and max(
-            bids, key=lambda b: b.bid).bid_by.id == request.user.id
-        max_bid_user = max(bids, key=lambda b: b.bid).bid_by if bids else None
-        comments = Comment.objects.filter(item=item)
-        watchlisted = request.user.is_authenticated and Watchlist.objects.filter(
-            item=item, user=request.user).count() > 0
-
-        return render(request, "auctions/listing.html", {
+        cursor = request.GET.get("comments")
+        return caching.cached_page(
+            request, ("listing", id, caching.listing_version(id), cursor),
+            lambda: listing_page(request, id, cursor))
+
+
+def listing_page(request, id, cursor):
+    item = Listing.objects.select_related(
+        "top_bidder", "created_by", "category").get(id=id)
+    is_max_bid = request.user.id is not None and \
+        item.top_bidder_id == request.user.id
+    try:
+        comments, next_comments = comment_page(item.id, cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor!")
+    watchlisted = item.id in caching.watched_listing_ids(request.user)
+
+    return render(request, "auctions/listing.html", {
+        "item": item,
+        "price": item.current_price,
+        "total_bids": item.bid_count,
+        "is_max_bid": is_max_bid,
+        "max_bid_user": item.top_bidder,
+        "watchlisted": watchlisted,
+        "watchlist_form": WatchlistForm(None, initial={
             "item": item,
-            "price": max(bids, key=lambda b: b.bid).bid if bids else item.price,
-            "total_bids": len(bids),
-            "is_max_bid": is_max_bid,
-            "max_bid_user": max_bid_user,
-            "watchlisted": watchlisted,
-            "watchlist_form": WatchlistForm(None, initial={
-                "item": item,
-                "delete": watchlisted,
-            }),
-            "bid_form": BidForm(None, initial={
-                "item": item,
-                "bid": 0,
-            }),
-            "comments": sorted(comments, key=lambda c: c.created, reverse=True),
-            "comment_form": CommentForm(None, initial={
-                "item": item,
-                "content": "",
-            }),
-        })
+            "delete": watchlisted,
+        }),
+        "bid_form": BidForm(None, initial={
+            "item": item,
+            "bid": 0,
+        }),
+        "proxy_bid_form": ProxyBidForm(None, initial={
+            "item": item,
+        }),
+        "comments": comments,
+        "next_comments": next_comments,
+        "comment_form": CommentForm(None, initial={
+            "item": item,
+            "content": "",
+        }),
+    })
+
+
+def comment_page(item_id, cursor=None):
+    return keyset_page(
+        Comment.objects.filter(item=item_id).select_related("created_by"),
+        cursor, COMMENTS_PER_PAGE)
+
+
+def comments(request, id):
+    try:
+        page, next_cursor = comment_page(id, request.GET.get("cursor"))
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor!")
+
+    return JsonResponse({
+        "html": render_to_string("auctions/comments.html", {
+            "comments": page
+        }, request),
+        "next_cursor": next_cursor,
+    })
+
+
+def bids(request, id):
+    try:
+        page, next_cursor = history.bid_page(
+            id, request.GET.get("cursor"), BIDS_PER_PAGE)
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor!")
+
+    return JsonResponse({
+        "bids": [{
+            "bid": bid.bid,
+            "bid_by": bid.bid_by.username,
+            "created": bid.created,
+        } for bid in page],
+        "next_cursor": next_cursor,
+    })
+
+
+def price_history(request, id):
+    try:
+        points = int(request.GET.get("points", PRICE_HISTORY_POINTS))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid points!")
+    if not 1 <= points <= MAX_PRICE_HISTORY_POINTS:
+        return HttpResponseBadRequest("Invalid points!")
+
+    # Each bid bumps the listing's version, so a chart polled by many
+    # viewers is downsampled once per new bid.
+    bucket_seconds, samples = caching.cached_value(
+        ("price-history", id, caching.listing_version(id), points),
+        lambda: history.price_history(id, points))
+    return JsonResponse({
+        "bucket_seconds": bucket_seconds,
+        "points": samples,
+    })
+
+
+def listing_events(request, id):
+    # Live updates are streamed by auctions.sse when served over ASGI,
+    # which intercepts this path. 204 tells EventSource to stop retrying.
+    return HttpResponse(status=204)
 
 
 def create_listing(request):
@@ -163,12 +300,16 @@ def create_listing(request):
         })
 
 
+@retry_on_lock
 def close_listing(request, id):
     if request.method == "POST":
         listing = Listing.objects.get(id=id)
         if request.user == listing.created_by:
             listing.closed = True
-            listing.save()
+            with transaction.atomic():
+                listing.save(update_fields=["closed"])
+                record_results([listing.id])
+            transaction.on_commit(lambda: publish_listing(listing))
             return HttpResponseRedirect(reverse("listing", args=[id]))
     return HttpResponseBadRequest("Invalid request!")
 
@@ -178,19 +319,25 @@ def bid(request):
         form = BidForm(request.POST)
         if form.is_valid():
             item = form.cleaned_data["item"]
-            bid = form.cleaned_data["bid"]
-            bids = Bid.objects.filter(item=item)
-            max_bid = max(
-                bids, key=lambda b: b.bid).bid if bids else item.price
-            if bid > max_bid:
-                obj = form.save(commit=False)
-                obj.bid_by = request.user
-                obj.save()
+            if place_bid(item.id, request.user, form.cleaned_data["bid"]):
                 return HttpResponseRedirect(reverse("listing", args=[item.id]))
 
         return HttpResponseBadRequest("Invalid bid!")
 
 
+def proxy_bid(request):
+    if request.method == "POST":
+        form = ProxyBidForm(request.POST)
+        if form.is_valid():
+            item = form.cleaned_data["item"]
+            if place_proxy_bid(item.id, request.user,
+                               form.cleaned_data["maximum"]) is not None:
+                return HttpResponseRedirect(reverse("listing", args=[item.id]))
+
+        return HttpResponseBadRequest("Invalid bid!")
+
+
+@retry_on_lock
 def comment(request):
     if request.method == "POST":
         form = CommentForm(request.POST)
@@ -203,6 +350,7 @@ def comment(request):
         return HttpResponseBadRequest("Invalid comment!")
 
 
+@retry_on_lock
 def watchlist(request):
     if request.method == "POST":
         form = WatchlistForm(request.POST)
@@ -211,28 +359,196 @@ def watchlist(request):
                 Watchlist.objects.filter(
                     item=form.cleaned_data["item"], user=request.user).delete()
             else:
-                obj = form.save(commit=False)
-                obj.user = request.user
-                obj.save()
+                # One INSERT OR IGNORE; adding twice is not an error.
+                Watchlist.objects.bulk_create([Watchlist(
+                    item=form.cleaned_data["item"], user=request.user)],
+                    ignore_conflicts=True)
+                caching.watchlist_changed(request.user.id)
             return HttpResponseRedirect(reverse("listing", args=[form.cleaned_data["item"].id]))
     else:
-        watchlist = Watchlist.objects.filter(user=request.user)
+        watchlist = Watchlist.objects.filter(
+            user=request.user).select_related("item").order_by("-id")
         return render(request, "auctions/watchlist.html", {
             "watchlist": watchlist
         })
 
 
+def listing_ids(values):
+    """Return a JSON list of listing ids as a set.
+
+    Raises ValueError unless every item is a JSON integer that can be a
+    primary key; floats and booleans are not silently truncated.
+    """
+    if not isinstance(values, list) or not all(
+            type(id) is int and 0 < id <= MAX_INTEGER for id in values):
+        raise ValueError(values)
+    return set(values)
+
+
+@retry_on_lock
+def watchlist_bulk(request):
+    """Add and remove many watchlist items in one JSON request.
+
+    Expects {"add": [listing ids], "remove": [listing ids]} and answers
+    with the ids actually added and removed, the ids that match no
+    listing, and the new size of the watchlist.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only."}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not signed in."}, status=401)
+    try:
+        body = json.loads(request.body)
+        add = listing_ids(body.get("add", []))
+        remove = listing_ids(body.get("remove", []))
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid request body."}, status=400)
+    if add & remove:
+        return JsonResponse(
+            {"error": "Listings both added and removed."}, status=400)
+    if len(add) + len(remove) > MAX_BULK_WATCHLIST:
+        return JsonResponse({"error": "At most %d listings per request." %
+                             MAX_BULK_WATCHLIST}, status=400)
+
+    watchlist = Watchlist.objects.filter(user=request.user)
+    with transaction.atomic():
+        existing = set(watchlist.filter(
+            item__in=add | remove).values_list("item_id", flat=True))
+        added = set(Listing.objects.filter(
+            id__in=add - existing).values_list("id", flat=True))
+        Watchlist.objects.bulk_create(
+            [Watchlist(item_id=id, user=request.user) for id in added],
+            ignore_conflicts=True)
+        removed = remove & existing
+        watchlist.filter(item__in=removed).delete()
+        caching.watchlist_changed(request.user.id)
+        watching = watchlist.count()
+
+    return JsonResponse({
+        "added": sorted(added),
+        "removed": sorted(removed),
+        "unknown": sorted(add - existing - added),
+        "watching": watching,
+    })
+
+
 def category(request, id=0):
     if id > 0:
-        category = Category.objects.get(id=id)
-        listings = Listing.objects.filter(category=id)
+        cursor = request.GET.get("cursor")
+
+        def render_page():
+            category = Category.objects.get(id=id)
+            try:
+                listings, next_cursor = category_page(id, cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor!")
+
+            return render(request, 'auctions/category.html', {
+                "category": category,
+                "listings": caching.with_versions(listings),
+                "next_cursor": next_cursor,
+            })
 
-        return render(request, 'auctions/category.html', {
-            "category": category,
-            "listings": listings
-        })
+        return caching.cached_page(
+            request, ("category", id, caching.feed_version(), cursor),
+            render_page)
     else:
-        categories = Category.objects.all()
         return render(request, 'auctions/categories.html', {
-            "categories": categories
+            "categories": category_counts()
         })
+
+
+def category_page(id, cursor=None):
+    return keyset_page(Listing.objects.filter(category=id, closed=False),
+                       cursor, LISTINGS_PER_PAGE)
+
+
+def category_counts():
+    """All categories with their number of open listings, from the cache.
+
+    Counted in one grouped query, recomputed only after listings were
+    added, closed or moved.
+    """
+    return caching.cached_value(
+        ("categories", caching.catalog_version()),
+        lambda: list(Category.objects.annotate(open_listings=Count(
+            "listing", filter=Q(listing__closed=False))).order_by("name")))
+
+
+def search(request):
+    query = request.GET.get("q", "")
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page!")
+    # The offset has to fit in an SQLite integer.
+    if (page - 1) * LISTINGS_PER_PAGE > MAX_INTEGER:
+        return HttpResponseBadRequest("Invalid page!")
+    listings, has_next = search_listings(query, page, LISTINGS_PER_PAGE)
+
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "listings": listings,
+        "page": page,
+        "next_page": page + 1 if has_next else None,
+        "previous_page": page - 1 if page > 1 else None,
+    })
+
+
+@staff_member_required
+def performance_stats(request):
+    return JsonResponse(rolling_stats.summary())
+
+
+@staff_member_required
+def export(request, kind):
+    format = request.GET.get("format", "ndjson")
+    try:
+        rows = export_rows(kind, **parse_filters(request.GET))
+        lines = render_rows(kind, rows, format)
+    except InvalidExport as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[format])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{format}"'
+    return response
+
+
+def image_variant(request, name):
+    if not IMAGE_VARIANT_NAME.fullmatch(name):
+        raise Http404("No such image!")
+    try:
+        image = default_storage.open(f"{images.VARIANT_DIR}/{name}")
+    except FileNotFoundError:
+        raise Http404("No such image!")
+
+    response = FileResponse(image)
+    # Names embed a hash of the source image, so their content never changes.
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+def proxied_image(request, variant):
+    url = request.GET.get("url", "")
+    if not image_proxy.check_signature(url, request.GET.get("sig", "")):
+        return HttpResponseBadRequest("Invalid image signature!")
+    if variant not in images.VARIANTS:
+        raise Http404("No such image size!")
+    format = "webp" if "image/webp" in request.headers.get("Accept", "") \
+        else "jpeg"
+
+    try:
+        data = image_proxy.proxied_image(url, variant, format)
+    except image_proxy.FetchError:
+        return HttpResponse("Image unavailable!", status=502)
+
+    etag = '"%s"' % hashlib.sha256(data).hexdigest()[:32]
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(data, content_type=f"image/{format}")
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=%d" % getattr(
+        settings, "IMAGE_PROXY_MAX_AGE", 86400)
+    response["Vary"] = "Accept"
+    return response
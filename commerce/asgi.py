@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from auctions.checks import report_startup_problems  # noqa: E402 (needs apps loaded)
+from auctions.sse import with_listing_events  # noqa: E402
+
+report_startup_problems()
+
+application = with_listing_events(django_application)
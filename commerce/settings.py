@@ -16,16 +16,26 @@ import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
+# Settings profile, chosen with the COMMERCE_PROFILE environment variable:
+# "development" (the default) or "production". The production profile is
+# checked at startup by auctions.checks.
+PROFILE = os.environ.get('COMMERCE_PROFILE', 'development')
+PRODUCTION = PROFILE == 'production'
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.0/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '6ps8j!crjgrxt34cqbqn7x&b3y%(fny8k8nh21+qa)%ws3fh!q'
+SECRET_KEY = os.environ.get(
+    'COMMERCE_SECRET_KEY',
+    '6ps8j!crjgrxt34cqbqn7x&b3y%(fny8k8nh21+qa)%ws3fh!q')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Besides leaking details, DEBUG keeps every executed query in memory.
+DEBUG = os.environ.get('COMMERCE_DEBUG', '0' if PRODUCTION else '1') == '1'
 
-ALLOWED_HOSTS = ['127.0.0.1', 'station.hnm.pw']
+ALLOWED_HOSTS = os.environ.get(
+    'COMMERCE_ALLOWED_HOSTS', '127.0.0.1,station.hnm.pw').split(',')
 
 
 # Application definition
@@ -41,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,9 +65,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'auctions.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -64,9 +74,19 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ],
         },
     },
 ]
+if PRODUCTION:
+    # Parse each template once per process instead of on every render.
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader',
+         TEMPLATES[0]['OPTIONS']['loaders']),
+    ]
 
 WSGI_APPLICATION = 'commerce.wsgi.application'
 
@@ -78,11 +98,46 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections, and the pragmas applied to them, across requests.
+        'CONN_MAX_AGE': int(os.environ.get(
+            'COMMERCE_CONN_MAX_AGE', 600 if PRODUCTION else 60)),
+        # A file-backed test database, so concurrent tests see the same
+        # locking behaviour as production instead of shared-cache table locks.
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
+# Applied to every new SQLite connection (auctions.database).
+# busy_timeout makes writers queue instead of failing.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    # Negative values are KiB rather than pages.
+    'cache_size': -16000,
+}
+# Write-ahead logging lets reads proceed during a write, and makes
+# synchronous=normal safe: a power loss can only drop the last commits.
+# The journal mode is stored in the database file, so it is off by
+# default in development, where db.sqlite3 is checked in.
+if os.environ.get('COMMERCE_SQLITE_WAL', '1' if PRODUCTION else '0') == '1':
+    SQLITE_PRAGMAS.update(journal_mode='wal', synchronous='normal')
+# Times a write that still finds the database locked is run again.
+SQLITE_LOCK_RETRIES = 5
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Sessions and the signed-in user are loaded on every request. Set
+# COMMERCE_SESSIONS to cached_db (cache first, database on a miss) or
+# signed_cookies (no server-side state), and COMMERCE_CACHE_USERS=1 to
+# load users through the cache, to take both off the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'COMMERCE_SESSIONS', 'cached_db' if PRODUCTION else 'db')
+
+if os.environ.get('COMMERCE_CACHE_USERS', '1' if PRODUCTION else '0') == '1':
+    AUTHENTICATION_BACKENDS = ['auctions.auth.CachedModelBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,6 +175,70 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.environ.get(
+    'COMMERCE_STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+if PRODUCTION:
+    # Hashed file names, so collected files can be cached forever.
+    STATICFILES_STORAGE = \
+        'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'auctions/static')
 MEDIA_URL = '/media/'
+
+
+# Per-request performance instrumentation (auctions.middleware)
+
+# Requests slower than this are logged together with their slowest query.
+PERFORMANCE_SLOW_REQUEST_MS = 500
+
+# Number of recent requests per URL name kept for percentile stats.
+PERFORMANCE_STATS_WINDOW = 1000
+
+
+# Live listing updates (auctions.events). The in-process backend only
+# reaches clients connected to the same worker; with several ASGI workers
+# use the SQLite backend so they share one event log, e.g.
+#     'BACKEND': 'auctions.events.SQLiteBackend',
+#     'OPTIONS': {'path': os.path.join(BASE_DIR, 'events.sqlite3')},
+AUCTION_EVENTS = {
+    'BACKEND': 'auctions.events.InProcessBackend',
+}
+
+# Threads resizing uploaded listing images (auctions.images).
+IMAGE_PIPELINE_WORKERS = 2
+# Larger uploaded or proxied images are refused before being decoded.
+IMAGE_MAX_PIXELS = 50_000_000
+
+# Pages for logged-out visitors and listing rows are cached under
+# per-listing version counters (auctions.caching). Any backend works; with
+# several worker processes use a shared one, e.g. FileBasedCache or
+# Memcached, so a bid invalidates the copies in every worker.
+if PRODUCTION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get(
+                'COMMERCE_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+PAGE_CACHE_TIMEOUT = 600
+
+# Steps by which proxy bids outbid each other: (from price, increment),
+# in ascending order of price.
+BID_INCREMENTS = [(0, 0.5), (10, 1), (100, 5), (1000, 25), (10000, 100)]
+
+# Remote image_url images are served through a local proxy that keeps the
+# originals and their resized copies in a bounded, least recently used
+# on-disk cache.
+IMAGE_PROXY_FETCHER = 'auctions.image_proxy.fetch_url'
+IMAGE_PROXY_CACHE_DIR = os.path.join(BASE_DIR, 'image_cache')
+IMAGE_PROXY_CACHE_BYTES = 256 * 1024 * 1024
+IMAGE_PROXY_MAX_AGE = 86400
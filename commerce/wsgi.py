@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
 application = get_wsgi_application()
+
+from auctions.checks import report_startup_problems  # noqa: E402 (needs apps loaded)
+
+report_startup_problems()